@@ -1,210 +1,623 @@
-import re
 import os
-from typing import Optional, Any, Dict, List
+import threading
+from time import monotonic
+from typing import Optional, Any, Callable, Dict, Iterator, NamedTuple, Tuple
 from datetime import datetime
-from functools import lru_cache
+import dask
+import dask.dataframe as dd
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
 from pandas import DataFrame, Series
+from analysis.derived_fields import base_models, brands, years
+from analysis.pagination import (DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, SORT_COLUMNS, SORT_ORDERS, CursorError,
+                                 chunks, decode_cursor, encode_cursor, page_positions, sorted_positions)
+from analysis.serialization import frame_records, to_json
+from database.parquet_export import (GENERATION_FORMAT, PRODUCTS_SCHEMA, SPECS_SCHEMA, REVIEWS_SCHEMA, SUMMARIES_NAME,
+                                     UNKNOWN_CATEGORY, current_generation, generation_dir, partition_name)
 
 
-def extract_base_model(name: str) -> str:
-    """Извлекает базовую модель из названия, убирая спецификации."""
-    if not isinstance(name, str):
-        return "Неизвестно"
+SNAPSHOT_CHECK_INTERVAL = 1.0   # Как часто запросы сверяют указатель текущего поколения, сек
+AVG_COLUMNS = {"rate": "Рейтинг", "price": "Цена"}     # Параметр /avg/{param} → столбец
 
-    name = re.sub(r'\([^)]*\)', '', name)
-    words = name.strip().split()
-    base = []
-    spec_patterns = ['/', 'гб', 'gb', 'ram', 'rom', 'мб', 'mb', 'tb', 'тб', 'ghz', 'ггц']
+ANALYSIS_ENGINE = "pandas"      # Движок по умолчанию: "pandas" (всё в памяти) или "dask" (по партициям)
+DASK_SCHEDULER = "threads"      # Планировщик dask: "threads" или "processes"
 
-    for w in words:
-        if any(spec in w.lower() for spec in spec_patterns):
-            break
-        if w.isdigit() and base:
-            break
-        base.append(w)
+ARROW_STRINGS = {pa.string(): pd.StringDtype("pyarrow")}
 
-    return " ".join(base) if base else name.strip()
+# Столбцы, которые движок dask держит в памяти; остальное читается с диска по запросу
+SLIM_COLUMNS = ["id", "Категория", "Наименование", "Рейтинг", "Всего_отзывов", "Цена"]
+# Производные столбцы, которые выгрузка считает заранее
+DERIVED_COLUMNS = ["Базовая_модель", "Бренд", "Год"]
+# Поля товара в списках: рейтинге устройств и выдаче по категории или бренду
+RATING_COLUMNS = ["id", "Наименование", "Рейтинг", "Всего_отзывов"]
+LISTING_COLUMNS = ["id", "Наименование", "Рейтинг", "Всего_отзывов", "Цена"]
 
 
-def extract_brand_from_model_or_name(row: Series) -> str:
-    """Извлекает бренд как первое слово из 'Модель' в характеристиках или 'Наименование'."""
-    char = row.get("Характеристики", {})
+def has_parquet_files(path: str) -> bool:
+    """Проверяет, что в каталоге таблицы есть хотя бы один parquet-файл"""
+    return os.path.isdir(path) and any(name.endswith(".parquet") for name in os.listdir(path))
 
-    if isinstance(char, dict):
-        model = char.get("Модель")
-        if isinstance(model, str) and model.strip():
-            return model.strip().split()[0]
 
-    name = row.get("Наименование", "")
-    if isinstance(name, str) and name.strip():
-        return name.split()[0]
+class GroupedTable:
+    """
+    Arrow-таблица, в которой строки каждого товара идут подряд, и смещения начала этих блоков.
+    Выгрузка пишет строки товара подряд, поэтому таблица сортируется только если это не так.
+    keys - отсортированные product_id, строки товара keys[i] - срез starts[i]:ends[i].
+    Строки одного товара достаются срезом без копирования.
+    """
+
+    def __init__(self, table: pa.Table):
+        product_ids = table.column("product_id").to_numpy()
+        # Начало блока - строка, в которой product_id отличается от предыдущей
+        changes = product_ids[1:] != product_ids[:-1]
+        starts = np.flatnonzero(np.concatenate(([len(product_ids) > 0], changes)))
+        order = np.argsort(product_ids[starts], kind="stable")
+        keys = product_ids[starts][order]
+        if len(keys) > 1 and not (keys[1:] > keys[:-1]).all():
+            # Блоки одного товара разорваны - нужна полная сортировка
+            table = table.sort_by("product_id")
+            product_ids = table.column("product_id").to_numpy()
+            keys, starts = np.unique(product_ids, return_index=True)
+            order = np.arange(len(keys))
+        ends = np.append(starts[1:], len(product_ids))
+        self.keys = keys
+        self.starts = starts[order]
+        self.ends = ends[order]
+        self.table = table.drop_columns(["product_id"])
+
+    def rows(self, product_id: int) -> pa.Table:
+        i = np.searchsorted(self.keys, product_id)
+        if i == len(self.keys) or self.keys[i] != product_id:
+            return self.table.slice(0, 0)
+        return self.table.slice(self.starts[i], self.ends[i] - self.starts[i])
+
+
+class ProductDetails:
+    """Характеристики и отзывы в колоночном виде; в словари собираются только для запрошенного товара"""
+
+    def __init__(self, specs: GroupedTable, reviews: GroupedTable):
+        self.specs = specs
+        self.reviews = reviews
+
+    def get(self, product_id: int, category: Optional[str] = None) -> dict:
+        """category нужна только DiskProductDetails"""
+        specs = self.specs.rows(product_id)
+        return {
+            "Характеристики": dict(zip(specs.column("key").to_pylist(), specs.column("value").to_pylist())),
+            "Отзывы": self.reviews.rows(product_id).to_pylist(),
+        }
+
+
+def read_grouped_table(path: str, schema: pa.Schema, dictionary_columns: Optional[list] = None) -> GroupedTable:
+    """dictionary_columns - столбцы с повторяющимися строками, которые хранятся словарём"""
+    if has_parquet_files(path):
+        try:
+            return GroupedTable(pq.read_table(path, read_dictionary=dictionary_columns))
+        except Exception as e:
+            print(f"Ошибка при загрузке {path}: {e}")
+    return GroupedTable(schema.empty_table())
 
-    return "Неизвестно"
 
+def spec_values(specs: GroupedTable, key: str) -> Series:
+    """Значение одной характеристики для каждого товара, у которого она есть"""
+    mask = pc.equal(specs.table.column("key"), key)
+    if not pc.any(mask).as_py():
+        return Series(dtype="object")
+    # Номер строки → товар по началам блоков (starts в порядке строк таблицы)
+    rows = np.flatnonzero(mask.to_numpy(zero_copy_only=False))
+    by_row = np.argsort(specs.starts)
+    owners = by_row[np.searchsorted(specs.starts[by_row], rows, side="right") - 1]
+    values = specs.table.column("value").filter(mask).to_pylist()
+    return Series(values, index=specs.keys[owners])
 
-def extract_year(char: dict) -> Optional[int]:
-    """Извлекает год релиза."""
-    val = char.get("Год релиза", "")
-    return int(val) if isinstance(val, str) and val.isdigit() else None
 
+def process_generation(generation_path: str) -> Tuple[DataFrame, ProductDetails]:
+    """
+    Загружает таблицу товаров поколения с производными полями.
+    Характеристики и отзывы остаются Arrow-таблицами, отсортированными по product_id.
+    Бренд, базовая модель и год обычно уже посчитаны выгрузкой.
+    """
+    products_path = os.path.join(generation_path, "products_main")
+    specs_path = os.path.join(generation_path, "specs")
+    reviews_path = os.path.join(generation_path, "reviews")
 
-def normalize_char(x: Any) -> Dict[str, Any]:
-    """Приводит характеристики к dict даже при None/str/bool."""
-    return x if isinstance(x, dict) else {}
+    # Проверка наличия основной таблицы
+    if not has_parquet_files(products_path):
+        raise FileNotFoundError(f"Таблица {products_path} не найдена.")
 
+    # Строки остаются в буферах Arrow, а не отдельными объектами Python
+    products_df = pq.read_table(products_path).to_pandas(types_mapper=ARROW_STRINGS.get)
+    specs = read_grouped_table(specs_path, SPECS_SCHEMA, ["key", "value"])
+    reviews = read_grouped_table(reviews_path, REVIEWS_SCHEMA, ["Срок использования"])
+
+    if not set(DERIVED_COLUMNS) <= set(products_df.columns):
+        # Поколение выгружено до появления производных столбцов - считаем их здесь
+        products_df["Модель"] = products_df["id"].map(spec_values(specs, "Модель"))
+        products_df["Год релиза"] = products_df["id"].map(spec_values(specs, "Год релиза"))
+    products_df = derive_slim_columns(products_df)
+    # Отдаём системе буферы, оставшиеся от чтения и сортировки
+    pa.default_memory_pool().release_unused()
+    return products_df, ProductDetails(specs, reviews)
+
+
+def compute_avg(pdf: DataFrame, param: str) -> dict:
+    col = AVG_COLUMNS[param]
+    agg_data = pdf.dropna(subset=[col])
+
+    result = {
+        f"avg_{param}_by_category": agg_data.groupby("Категория")[col].mean().round(2).to_dict(),
+        f"avg_{param}_by_brand": agg_data.groupby("Бренд")[col]
+        .mean()
+        .sort_values(ascending=False)
+        .head(20)
+        .round(2)
+        .to_dict(),
+    }
+
+    if pdf["Год"].notna().any():
+        yearly_agg = pdf.dropna(subset=["Год", col]).groupby("Год")[col].mean().round(2).sort_index()
+        result[f"avg_{param}_by_year"] = yearly_agg.to_dict()
 
-def convert_numpy_types_in_list(lst: List[Dict]) -> List[Dict]:
-    """Конвертирует numpy-типы в стандартные Python-типы."""
-    result = []
-    for item in lst:
-        clean_item = {}
-        for k, v in item.items():
-            if isinstance(v, (np.integer, np.int64, np.int32)):
-                clean_item[k] = int(v)
-            elif isinstance(v, (np.floating, np.float64, np.float32)):
-                clean_item[k] = float(v) if not pd.isna(v) else None
-            elif pd.isna(v):
-                clean_item[k] = None
-            else:
-                clean_item[k] = v
-        result.append(clean_item)
     return result
 
 
-@lru_cache(maxsize=2)
-def load_and_process_data(parquet_path: str = "./data/products.parquet") -> DataFrame:
+def compute_aggregates(pdf: DataFrame, generation: str) -> dict:
     """
-    Загружает данные из трёх Parquet-файлов и воссоздаёт единый DataFrame.
+    Сводки для дашборда, которые считаются один раз на поколение данных.
+    Эндпоинты отдают готовые словари и не зависят от размера каталога.
     """
-    base_dir = os.path.dirname(parquet_path)
-    products_path = os.path.join(base_dir, "products_main.parquet")
-    specs_path = os.path.join(base_dir, "specs.parquet")
-    reviews_path = os.path.join(base_dir, "reviews.parquet")
+    return {
+        "info": {
+            "total_products": len(pdf),
+            "total_reviews": int(pdf["Всего_отзывов"].fillna(0).sum()),
+            "last_parsing": datetime.strptime(generation, GENERATION_FORMAT).isoformat()
+        },
+        "count": {
+            "category_distribution": pdf["Категория"].value_counts().to_dict(),
+            "brand_distribution": pdf["Бренд"].value_counts().to_dict()
+        },
+        "avg": {param: compute_avg(pdf, param) for param in AVG_COLUMNS},
+        "brands_by_reviews": (
+            pdf.groupby("Бренд")["Всего_отзывов"]
+            .sum()
+            .fillna(0)
+            .astype(int)
+            .sort_values(ascending=False)
+            .to_dict()
+        ),
+    }
 
-    # Проверка наличия основного файла
-    if not os.path.exists(products_path):
-        raise FileNotFoundError(f"Файл {products_path} не найден.")
 
-    # Загрузка основной таблицы
-    products_df = pd.read_parquet(products_path)
+def pandas_snapshot_data(generation_path: str, generation: str) -> tuple:
+    """Движок pandas: товары, характеристики и отзывы в памяти"""
+    data, details = process_generation(generation_path)
+    return data, compute_aggregates(data, generation), details
 
-    # Восстановление характеристик
-    if os.path.exists(specs_path) and os.path.getsize(specs_path) > 0:
-        try:
-            specs_df = pd.read_parquet(specs_path)
-            char_dict = (
-                specs_df.groupby("product_id")
-                .apply(lambda x: dict(zip(x["key"], x["value"])))
-                .to_dict()
-            )
-            products_df["Характеристики"] = products_df["id"].map(char_dict).fillna({})
-        except Exception as e:
-            print(f"Ошибка при загрузке характеристик: {e}")
-            products_df["Характеристики"] = [{} for _ in range(len(products_df))]
+
+def derive_slim_columns(part: DataFrame) -> DataFrame:
+    """
+    Приведение типов и производные поля таблицы товаров (или одной партиции для dask).
+    Если выгрузка не посчитала производные поля, они выводятся из столбцов "Модель" и "Год релиза".
+    """
+    part = part.assign(
+        Рейтинг=pd.to_numeric(part["Рейтинг"], errors="coerce"),
+        Всего_отзывов=pd.to_numeric(part["Всего_отзывов"], errors="coerce"),
+        Цена=pd.to_numeric(part["Цена"], errors="coerce"),
+    )
+    if "Модель" in part.columns:
+        part = part.assign(
+            Базовая_модель=base_models(part["Наименование"]),
+            Бренд=brands(part["Модель"], part["Наименование"]),
+            Год=years(part["Год релиза"]),
+        ).drop(columns=["Модель", "Год релиза"])
+    return part.astype({"Год": "float64"})
+
+
+def read_slim_products(generation_path: str) -> dd.DataFrame:
+    """Ленивая таблица товаров без описаний, характеристик и отзывов"""
+    products_path = os.path.join(generation_path, "products_main")
+    specs_path = os.path.join(generation_path, "specs")
+    if set(DERIVED_COLUMNS) <= set(ds.dataset(products_path, format="parquet").schema.names):
+        products = dd.read_parquet(products_path, columns=SLIM_COLUMNS + DERIVED_COLUMNS)
+    elif has_parquet_files(specs_path):
+        # Поколение без производных столбцов: из характеристик читаются только строки
+        # модели и года - фильтр уходит в чтение parquet
+        products = dd.read_parquet(products_path, columns=SLIM_COLUMNS)
+        specs = dd.read_parquet(specs_path, columns=["product_id", "key", "value"],
+                                filters=[("key", "in", ["Модель", "Год релиза"])])
+        for key in ("Модель", "Год релиза"):
+            values = specs[specs["key"] == key][["product_id", "value"]].rename(columns={"value": key})
+            products = products.merge(values, how="left", left_on="id", right_on="product_id")
+            products = products.drop(columns=["product_id"])
     else:
-        products_df["Характеристики"] = [{} for _ in range(len(products_df))]
+        products = dd.read_parquet(products_path, columns=SLIM_COLUMNS)
+        products = products.assign(**{"Модель": None, "Год релиза": None})
+
+    meta = products._meta.drop(columns=["Модель", "Год релиза"], errors="ignore").assign(
+        Рейтинг=pd.Series(dtype="float64"),
+        Всего_отзывов=pd.Series(dtype="float64"),
+        Цена=pd.Series(dtype="float64"),
+        Базовая_модель=pd.Series(dtype="object"),
+        Бренд=pd.Series(dtype="object"),
+        Год=pd.Series(dtype="float64"),
+    )
+    return products.map_partitions(derive_slim_columns, meta=meta)
+
+
+def dask_snapshot_data(generation_path: str, generation: str) -> tuple:
+    """
+    Движок dask: сводки считаются по партициям с частичной агрегацией на всех ядрах,
+    в памяти остаются только лёгкие столбцы для индексов и списков товаров.
+    Описание, характеристики и отзывы товара читаются с диска по запросу (DiskProductDetails).
+    """
+    products = read_slim_products(generation_path)
+    lazy = {
+        "total_products": products["id"].count(),
+        "total_reviews": products["Всего_отзывов"].fillna(0).sum(),
+        "category_distribution": products["Категория"].value_counts(),
+        "brand_distribution": products["Бренд"].value_counts(),
+        "brands_by_reviews": products.groupby("Бренд", dropna=True)["Всего_отзывов"].sum(),
+    }
+    for param, col in AVG_COLUMNS.items():
+        rated = products.dropna(subset=[col])
+        lazy[f"{param}_by_category"] = rated.groupby("Категория", dropna=True)[col].mean()
+        lazy[f"{param}_by_brand"] = rated.groupby("Бренд", dropna=True)[col].mean()
+        lazy[f"{param}_by_year"] = products.dropna(subset=["Год", col]).groupby("Год")[col].mean()
+
+    data, result = dask.compute(products, lazy, scheduler=DASK_SCHEDULER)
+    data = data.reset_index(drop=True)
+
+    avg = {}
+    for param in AVG_COLUMNS:
+        avg[param] = {
+            f"avg_{param}_by_category": result[f"{param}_by_category"].round(2).to_dict(),
+            f"avg_{param}_by_brand": result[f"{param}_by_brand"]
+            .sort_values(ascending=False)
+            .head(20)
+            .round(2)
+            .to_dict(),
+        }
+        if len(result[f"{param}_by_year"]):
+            avg[param][f"avg_{param}_by_year"] = result[f"{param}_by_year"].round(2).sort_index().to_dict()
+
+    aggregates = {
+        "info": {
+            "total_products": int(result["total_products"]),
+            "total_reviews": int(result["total_reviews"]),
+            "last_parsing": datetime.strptime(generation, GENERATION_FORMAT).isoformat()
+        },
+        "count": {
+            "category_distribution": result["category_distribution"].sort_values(ascending=False).to_dict(),
+            "brand_distribution": result["brand_distribution"].sort_values(ascending=False).to_dict()
+        },
+        "avg": avg,
+        "brands_by_reviews": result["brands_by_reviews"].fillna(0).astype(int).sort_values(ascending=False).to_dict(),
+    }
+    return data, aggregates, DiskProductDetails(generation_path)
 
-    # Восстановление отзывов
-    if os.path.exists(reviews_path) and os.path.getsize(reviews_path) > 0:
+
+class DiskProductDetails:
+    """
+    Описание, характеристики и отзывы одного товара с диска.
+    id - хеш ссылки и по файлу не отсортированы, так что статистика row group'ов ничего не отсекает;
+    вместо этого читается только файл партиции категории товара (она известна из таблицы в памяти).
+    Без категории просматриваются все файлы.
+    """
+
+    def __init__(self, generation_path: str):
+        self.generation_path = generation_path
+
+    def _read(self, table_name: str, schema: pa.Schema, column: str, product_id: int, columns: list,
+              category: Optional[str]) -> pa.Table:
+        path = os.path.join(self.generation_path, table_name)
+        if category is not None:
+            path = os.path.join(path, partition_name(category) + ".parquet")
+            if not os.path.exists(path):
+                return schema.empty_table().select(columns)
+        elif not has_parquet_files(path):
+            return schema.empty_table().select(columns)
+        dataset = ds.dataset(path, format="parquet", schema=schema)
+        return dataset.to_table(columns=columns, filter=ds.field(column) == product_id)
+
+    def get(self, product_id: int, category: Optional[str] = None) -> dict:
+        product = self._read("products_main", PRODUCTS_SCHEMA, "id", product_id, ["Ссылка", "Описание"], category)
+        specs = self._read("specs", SPECS_SCHEMA, "product_id", product_id, ["key", "value"], category)
+        reviews = self._read("reviews", REVIEWS_SCHEMA, "product_id", product_id, REVIEWS_SCHEMA.names[1:],
+                             category)
+        details = product.to_pylist()[0] if product.num_rows else {}
+        details["Характеристики"] = dict(zip(specs.column("key").to_pylist(), specs.column("value").to_pylist()))
+        details["Отзывы"] = reviews.to_pylist()
+        return details
+
+
+ENGINES = {
+    "pandas": pandas_snapshot_data,
+    "dask": dask_snapshot_data,
+}
+
+
+def build_indexes(pdf: DataFrame) -> dict:
+    """
+    Хеш-индексы снимка: id → позиция строки, категория и бренд → массив позиций,
+    позиции товаров с рейтингом. Поиск по ним стоит O(размер результата) вместо прохода по всей таблице.
+    """
+    return {
+        "id": dict(zip(pdf["id"].tolist(), range(len(pdf)))),
+        "category": pdf.groupby("Категория").indices,
+        "brand": pdf.groupby("Бренд").indices,
+        "rated": np.flatnonzero(pdf["Рейтинг"].notna().to_numpy()),
+    }
+
+
+class Snapshot(NamedTuple):
+    """
+    Данные одного поколения: таблица товаров, посчитанные по ней сводки, индексы,
+    источник характеристик и отзывов отдельного товара (объект с методом get(product_id))
+    и закодированные JSON-ответы уровня снимка (заполняются при первом запросе)
+    """
+    generation: str
+    data: DataFrame
+    aggregates: dict
+    indexes: dict
+    details: Any
+    responses: dict
+
+
+def load_snapshot_from(base_dir: str, generation: str, engine: Optional[str] = None) -> Snapshot:
+    data, aggregates, details = ENGINES[engine or ANALYSIS_ENGINE](generation_dir(base_dir, generation), generation)
+    return Snapshot(generation, data, aggregates, build_indexes(data), details, {})
+
+
+class SnapshotManager:
+    """
+    Обработанный DataFrame текущего поколения выгрузки.
+    Запрос лишь изредка (раз в check_interval) сверяет указатель CURRENT, а новое поколение
+    загружается один раз в фоновом потоке; пока оно грузится, запросы получают предыдущее.
+    Блокирует только самая первая загрузка, когда отдавать ещё нечего.
+    """
+
+    def __init__(self, base_dir: str, check_interval: float = SNAPSHOT_CHECK_INTERVAL,
+                 engine: Optional[str] = None):
+        self.base_dir = base_dir
+        self.check_interval = check_interval
+        self.engine = engine
+        # Снимок меняется целиком одной операцией присваивания
+        self.snapshot: Optional[Snapshot] = None
+        self.loading: Optional[str] = None
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+        self.initial_lock = threading.Lock()
+
+    def get(self) -> Snapshot:
+        snapshot = self.snapshot
+        if snapshot is None:
+            return self._load_initial()
+        self._check()
+        return snapshot
+
+    def _load_initial(self) -> Snapshot:
+        with self.initial_lock:
+            if self.snapshot is None:
+                generation = current_generation(self.base_dir)
+                if generation is None:
+                    raise FileNotFoundError(f"В {self.base_dir} ещё нет выгруженных данных.")
+                self.snapshot = load_snapshot_from(self.base_dir, generation, self.engine)
+                self.checked_at = monotonic()
+        return self.snapshot
+
+    def _check(self):
+        now = monotonic()
+        with self.lock:
+            if self.loading is not None or now - self.checked_at < self.check_interval:
+                return
+            self.checked_at = now
+            generation = current_generation(self.base_dir)
+            if generation is None or generation == self.snapshot.generation:
+                return
+            self.loading = generation
+        threading.Thread(target=self._reload, args=(generation,), name="snapshot-reload", daemon=True).start()
+
+    def _reload(self, generation: str):
         try:
-            reviews_df = pd.read_parquet(reviews_path)
-            reviews_list = (
-                reviews_df.groupby("product_id")
-                .apply(lambda x: x.drop(columns=["product_id"]).to_dict(orient="records"))
-                .to_dict()
-            )
-            products_df["Отзывы"] = products_df["id"].map(reviews_list).fillna([]).apply(
-                lambda x: x if isinstance(x, list) else []
-            )
+            self.snapshot = load_snapshot_from(self.base_dir, generation, self.engine)
+            print(f"Загружено поколение данных {generation}")
         except Exception as e:
-            print(f"Ошибка при загрузке отзывов: {e}")
-            products_df["Отзывы"] = [[] for _ in range(len(products_df))]
-    else:
-        products_df["Отзывы"] = [[] for _ in range(len(products_df))]
+            print(f"Ошибка при загрузке поколения {generation}: {e}")
+        finally:
+            self.loading = None
+
+
+snapshot_managers: Dict[str, SnapshotManager] = {}
+snapshot_managers_lock = threading.Lock()
+
+
+def load_snapshot(parquet_path: str = "./data/products.parquet") -> Snapshot:
+    """Снимок текущего поколения из каталога, в котором лежит parquet_path"""
+    base_dir = os.path.dirname(parquet_path)
+    with snapshot_managers_lock:
+        manager = snapshot_managers.get(base_dir)
+        if manager is None:
+            manager = snapshot_managers[base_dir] = SnapshotManager(base_dir)
+    return manager.get()
+
+
+class SummaryStore:
+    """
+    Сводки модели по товарам из summaries.parquet (их пишет пакетная генерация model.summaries).
+    Файл перечитывается целиком, когда меняется его mtime; проверка - не чаще раза в check_interval.
+    """
+
+    def __init__(self, path: str, check_interval: float = SNAPSHOT_CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self.summaries: Dict[int, str] = {}
+        self.mtime: Optional[int] = None
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+
+    def get(self, product_id: int) -> Optional[str]:
+        self._check()
+        return self.summaries.get(product_id)
+
+    def _check(self):
+        now = monotonic()
+        if now - self.checked_at < self.check_interval:
+            return
+        with self.lock:
+            if now - self.checked_at < self.check_interval:
+                return
+            self.checked_at = now
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+                if mtime != self.mtime:
+                    table = pq.read_table(self.path, columns=["id", "summary"])
+                    self.summaries = dict(zip(table.column("id").to_pylist(), table.column("summary").to_pylist()))
+                    self.mtime = mtime
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"Ошибка при чтении сводок {self.path}: {e}")
+
+
+summary_stores: Dict[str, SummaryStore] = {}
+
+
+def load_summary_store(parquet_path: str = "./data/products.parquet") -> SummaryStore:
+    base_dir = os.path.dirname(parquet_path)
+    with snapshot_managers_lock:
+        store = summary_stores.get(base_dir)
+        if store is None:
+            store = summary_stores[base_dir] = SummaryStore(os.path.join(base_dir, SUMMARIES_NAME))
+    return store
 
-    # Преобразования
-    products_df["Характеристики"] = products_df["Характеристики"].apply(normalize_char)
-    products_df["Рейтинг"] = pd.to_numeric(products_df["Рейтинг"], errors="coerce")
-    products_df["Всего_отзывов"] = pd.to_numeric(products_df["Всего_отзывов"], errors="coerce")
-    products_df["Цена"] = pd.to_numeric(products_df["Цена"], errors="coerce")
 
-    # Дополнительные поля
-    products_df["Базовая_модель"] = products_df["Наименование"].apply(extract_base_model)
-    products_df["Бренд"] = products_df.apply(extract_brand_from_model_or_name, axis=1)
-    products_df["Год"] = products_df["Характеристики"].apply(extract_year)
+def load_and_process_data(parquet_path: str = "./data/products.parquet") -> DataFrame:
+    return load_snapshot(parquet_path).data
 
-    return products_df
+
+def cached_json(func: Callable, *args, parquet_path: str = "./data/products.parquet") -> bytes:
+    """
+    JSON-байты ответа func(*args), который зависит только от снимка.
+    Кодируются один раз на поколение и дальше отдаются без повторной сериализации.
+    """
+    snapshot = load_snapshot(parquet_path)
+    key = (func.__name__, args)
+    body = snapshot.responses.get(key)
+    if body is None:
+        body = snapshot.responses[key] = to_json(func(*args, parquet_path=parquet_path))
+    return body
 
 
 def get_info(parquet_path: str = "./data/products.parquet") -> dict:
-    pdf = load_and_process_data(parquet_path)
-    return {
-        "total_products": len(pdf),
-        "total_reviews": int(pdf["Всего_отзывов"].fillna(0).sum()),
-        "last_parsing": datetime.now().isoformat()
-    }
+    return load_snapshot(parquet_path).aggregates["info"]
 
 
 def get_count(parquet_path: str = "./data/products.parquet") -> dict:
-    pdf = load_and_process_data(parquet_path)
-    return {
-        "category_distribution": pdf["Категория"].value_counts().to_dict(),
-        "brand_distribution": pdf["Бренд"].value_counts().to_dict()
-    }
+    return load_snapshot(parquet_path).aggregates["count"]
 
 
 def get_avg(param: str, parquet_path: str = "./data/products.parquet") -> dict:
-    pdf = load_and_process_data(parquet_path)
-
-    if param == "rate":
-        agg_data = pdf.dropna(subset=["Рейтинг"])
-        col = "Рейтинг"
-    elif param == "price":
-        agg_data = pdf.dropna(subset=["Цена"])
-        col = "Цена"
-    else:
+    if param not in AVG_COLUMNS:
         return {"error": "Invalid parameter. Use 'rate' or 'price'"}
+    return load_snapshot(parquet_path).aggregates["avg"][param]
 
-    result = {
-        f"avg_{param}_by_category": agg_data.groupby("Категория")[col].mean().round(2).to_dict(),
-        f"avg_{param}_by_brand": agg_data.groupby("Бренд")[col]
-        .mean()
-        .sort_values(ascending=False)
-        .head(20)
-        .round(2)
-        .to_dict(),
+
+def rating_records(frame: DataFrame) -> list:
+    return frame_records(
+        frame[RATING_COLUMNS]
+        .assign(
+            Рейтинг=lambda x: x["Рейтинг"].round(2),
+            Всего_отзывов=lambda x: x["Всего_отзывов"].fillna(0).astype(int)
+        )
+    )
+
+
+def listing_records(frame: DataFrame) -> list:
+    return frame_records(
+        frame[LISTING_COLUMNS]
+        .assign(
+            Рейтинг=lambda x: x["Рейтинг"].round(2).astype(float),
+            Всего_отзывов=lambda x: x["Всего_отзывов"].fillna(0).astype(int),
+            Цена=lambda x: x["Цена"].fillna(0).astype(float)
+        )
+    )
+
+
+def sort_error(sort: str, order: str) -> Optional[str]:
+    if sort not in SORT_COLUMNS:
+        return f"Invalid sort. Use one of: {', '.join(SORT_COLUMNS)}"
+    if order not in SORT_ORDERS:
+        return f"Invalid order. Use one of: {', '.join(SORT_ORDERS)}"
+    return None
+
+
+def sort_arrays(snapshot: Snapshot, positions: np.ndarray, sort: str) -> tuple:
+    """Значения ключа сортировки и id для строк positions"""
+    values = snapshot.data[SORT_COLUMNS[sort]].to_numpy(dtype="float64", na_value=np.nan)
+    ids = snapshot.data["id"].to_numpy(dtype="int64")
+    return values[positions], ids[positions]
+
+
+def listing_page(snapshot: Snapshot, positions: np.ndarray, to_records: Callable, limit: int,
+                 cursor: Optional[str], sort: str, order: str) -> dict:
+    """
+    Страница списка: top-k частичной сортировкой вместо сортировки всего списка
+    и курсор на продолжение (next_cursor = None на последней странице).
+    """
+    error = sort_error(sort, order)
+    if error:
+        return {"error": error}
+    limit = min(max(int(limit), 1), MAX_PAGE_SIZE)
+    try:
+        after = decode_cursor(cursor, sort, order) if cursor else None
+    except CursorError as e:
+        return {"error": str(e)}
+
+    page, following = page_positions(*sort_arrays(snapshot, positions, sort), order, limit, after)
+    return {
+        "items": to_records(snapshot.data.iloc[positions[page]]),
+        "next_cursor": encode_cursor(sort, order, *following) if following else None,
     }
 
-    if pdf["Год"].notna().any():
-        yearly_agg = pdf.dropna(subset=["Год", col]).groupby("Год")[col].mean().round(2).sort_index()
-        result[f"avg_{param}_by_year"] = yearly_agg.to_dict()
 
-    return result
+def stream_listing(snapshot: Snapshot, positions: np.ndarray, to_records: Callable,
+                   sort: str, order: str) -> Iterator[bytes]:
+    """NDJSON всего списка: по одному товару в строке, кодируется частями по STREAM_CHUNK_SIZE"""
+    ordered = positions[sorted_positions(*sort_arrays(snapshot, positions, sort), order)]
+    for chunk in chunks(ordered):
+        yield b"".join(to_json(record) + b"\n" for record in to_records(snapshot.data.iloc[chunk]))
 
 
 def get_rate_devices(parquet_path: str = "./data/products.parquet") -> dict:
     pdf = load_and_process_data(parquet_path)
     rated = pdf.dropna(subset=["Рейтинг"]).sort_values("Рейтинг", ascending=False)
-    result_list = rated[["id", "Наименование", "Рейтинг", "Всего_отзывов"]] \
-        .assign(
-        id=lambda x: x["id"].astype(int),
-        Рейтинг=lambda x: x["Рейтинг"].round(2),
-        Всего_отзывов=lambda x: x["Всего_отзывов"].fillna(0).astype(int)
-    ) \
-        .to_dict(orient="records")
-    return {"devices_by_rating": result_list}
+    return {"devices_by_rating": rating_records(rated)}
+
+
+def get_rate_devices_page(limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None, sort: str = "rating",
+                          order: str = "desc", parquet_path: str = "./data/products.parquet") -> dict:
+    snapshot = load_snapshot(parquet_path)
+    return listing_page(snapshot, snapshot.indexes["rated"], rating_records, limit, cursor, sort, order)
+
+
+def stream_rate_devices(sort: str = "rating", order: str = "desc",
+                        parquet_path: str = "./data/products.parquet") -> Iterator[bytes]:
+    snapshot = load_snapshot(parquet_path)
+    yield from stream_listing(snapshot, snapshot.indexes["rated"], rating_records, sort, order)
 
 
 def get_brand_info(brand_name: str, parquet_path: str = "./data/products.parquet") -> dict:
     try:
-        pdf = load_and_process_data(parquet_path)
-        brand_mask = pdf["Бренд"] == brand_name
-        brand_df = pdf[brand_mask].copy()
-
-        if brand_df.empty:
+        snapshot = load_snapshot(parquet_path)
+        pdf = snapshot.data
+        positions = snapshot.indexes["brand"].get(brand_name)
+        if positions is None:
             return {"error": f"Brand '{brand_name}' not found"}
+        brand_df = pdf.iloc[positions]
 
         device_count = int(len(brand_df))
         total_devices = len(pdf)
@@ -221,18 +634,7 @@ def get_brand_info(brand_name: str, parquet_path: str = "./data/products.parquet
             "total_reviews": int(brand_df["Всего_отзывов"].sum())
         }
 
-        devices_list = (
-            brand_df[["id", "Наименование", "Рейтинг", "Всего_отзывов", "Цена"]]
-            .assign(
-                id=lambda x: x["id"].astype(int),
-                Рейтинг=lambda x: x["Рейтинг"].round(2).astype(float),
-                Всего_отзывов=lambda x: x["Всего_отзывов"].fillna(0).astype(int),
-                Цена=lambda x: x["Цена"].fillna(0).astype(float)
-            )
-            .to_dict(orient="records")
-        )
-
-        stats["devices"] = convert_numpy_types_in_list(devices_list)
+        stats["devices"] = listing_records(brand_df)
         return stats
 
     except Exception as e:
@@ -241,70 +643,53 @@ def get_brand_info(brand_name: str, parquet_path: str = "./data/products.parquet
 
 
 def get_products_by_category(category_name: str, parquet_path: str = "./data/products.parquet") -> dict:
-    pdf = load_and_process_data(parquet_path)
-    filtered = pdf[pdf["Категория"] == category_name].copy()
-    if filtered.empty:
+    snapshot = load_snapshot(parquet_path)
+    positions = snapshot.indexes["category"].get(category_name)
+    if positions is None:
         return {}
+    records = listing_records(snapshot.data.iloc[positions])
+    return {item["id"]: item for item in records}
 
-    prepared = (
-        filtered[["id", "Наименование", "Рейтинг", "Всего_отзывов", "Цена"]]
-        .assign(
-            id=lambda x: x["id"].astype(int),
-            Рейтинг=lambda x: x["Рейтинг"].round(2).astype(float),
-            Всего_отзывов=lambda x: x["Всего_отзывов"].fillna(0).astype(int),
-            Цена=lambda x: x["Цена"].fillna(0).astype(float)
-        )
-    )
 
-    records = convert_numpy_types_in_list(prepared.to_dict(orient="records"))
-    return {item["id"]: item for item in records}
+def get_products_by_category_page(category_name: str, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None,
+                                  sort: str = "id", order: str = "asc",
+                                  parquet_path: str = "./data/products.parquet") -> dict:
+    snapshot = load_snapshot(parquet_path)
+    positions = snapshot.indexes["category"].get(category_name)
+    if positions is None:
+        return {}
+    return listing_page(snapshot, positions, listing_records, limit, cursor, sort, order)
+
+
+def stream_products_by_category(category_name: str, sort: str = "id", order: str = "asc",
+                                parquet_path: str = "./data/products.parquet") -> Iterator[bytes]:
+    snapshot = load_snapshot(parquet_path)
+    positions = snapshot.indexes["category"].get(category_name)
+    if positions is not None:
+        yield from stream_listing(snapshot, positions, listing_records, sort, order)
 
 
 def get_product_by_id(product_id: int, parquet_path: str = "./data/products.parquet") -> dict:
-    pdf = load_and_process_data(parquet_path)
+    snapshot = load_snapshot(parquet_path)
 
     try:
         product_id = int(product_id)
     except (TypeError, ValueError):
         return {}
 
-    pdf["id"] = pd.to_numeric(pdf["id"], errors="coerce")
-    product_row = pdf[pdf["id"] == product_id]
-    if product_row.empty:
+    position = snapshot.indexes["id"].get(product_id)
+    if position is None:
         return {}
 
-    record = product_row.iloc[0].to_dict()
-
-    def clean_value(val):
-        if val is None:
-            return None
-        if isinstance(val, (np.integer, np.int64, np.int32)):
-            return int(val)
-        elif isinstance(val, (np.floating, np.float64, np.float32)):
-            return float(val) if not pd.isna(val) else None
-        elif isinstance(val, (np.bool_, bool)):
-            return bool(val)
-        if pd.api.types.is_scalar(val) and pd.isna(val):
-            return None
-        if isinstance(val, dict):
-            return {k: clean_value(v) for k, v in val.items()}
-        if isinstance(val, (list, tuple, np.ndarray)):
-            val = val.tolist() if isinstance(val, np.ndarray) else val
-            return [clean_value(item) for item in val]
-        return val
-
-    clean_record = {k: clean_value(v) for k, v in record.items()}
-    return clean_record
+    # Характеристики и отзывы из Arrow уже приходят в типах Python
+    record = frame_records(snapshot.data.iloc[[position]])[0]
+    # Товары без категории выгрузка кладёт в партицию UNKNOWN_CATEGORY
+    record.update(snapshot.details.get(product_id, record.get("Категория") or UNKNOWN_CATEGORY))
+    # Достоинства и недостатки, заранее сгенерированные моделью (None, если сводки ещё нет)
+    record["Сводка"] = load_summary_store(parquet_path).get(product_id)
+    return record
 
 
 def get_brands_by_reviews(parquet_path: str = "./data/products.parquet") -> dict:
     """Возвращает топ брендов по общему количеству отзывов."""
-    pdf = load_and_process_data(parquet_path)
-    reviews_by_brand = (
-        pdf.groupby("Бренд")["Всего_отзывов"]
-        .sum()
-        .fillna(0)
-        .astype(int)
-        .sort_values(ascending=False)
-    )
-    return reviews_by_brand.to_dict()
+    return load_snapshot(parquet_path).aggregates["brands_by_reviews"]
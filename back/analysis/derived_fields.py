@@ -0,0 +1,120 @@
+import re
+from typing import Any, Optional
+import numpy as np
+import pandas as pd
+from pandas import Series
+
+
+UNKNOWN = "Неизвестно"
+SPEC_PATTERNS = ['/', 'гб', 'gb', 'ram', 'rom', 'мб', 'mb', 'tb', 'тб', 'ghz', 'ггц']
+BASE_MODEL_CACHE_SIZE = 500_000     # Сколько названий помнить между снимками
+
+# Базовая модель - слова названия до первого со спецификацией (или до числа после первого слова)
+_SPEC = "|".join(re.escape(spec) for spec in SPEC_PATTERNS)
+_WORD = rf"(?!\S*(?:{_SPEC}))\S+"
+BASE_MODEL_PATTERN = rf"(?i)^\s*({_WORD}(?:\s+(?!\d+(?:\s|$)){_WORD})*)"
+PARENTHESES_PATTERN = r"\([^)]*\)"
+FIRST_WORD_PATTERN = r"^\s*(\S+)"
+
+# Результаты разбора названий, общие для всех поколений данных
+base_model_cache: dict[str, str] = {}
+
+
+def extract_base_model(name: str) -> str:
+    """Извлекает базовую модель из названия, убирая спецификации."""
+    if not isinstance(name, str):
+        return UNKNOWN
+
+    name = re.sub(PARENTHESES_PATTERN, '', name)
+    words = name.strip().split()
+    base = []
+
+    for w in words:
+        if any(spec in w.lower() for spec in SPEC_PATTERNS):
+            break
+        if w.isdecimal() and base:
+            break
+        base.append(w)
+
+    return " ".join(base) if base else name.strip()
+
+
+def extract_brand(model: Any, name: Any) -> str:
+    """Бренд - первое слово модели, а если её нет, первое слово названия."""
+    if isinstance(model, str) and model.strip():
+        return model.strip().split()[0]
+
+    if isinstance(name, str) and name.strip():
+        return name.split()[0]
+
+    return UNKNOWN
+
+
+def cached_base_model(name: Any) -> str:
+    """extract_base_model с тем же кэшем, что и у векторного base_models"""
+    if not isinstance(name, str):
+        return UNKNOWN
+    result = base_model_cache.get(name)
+    if result is None:
+        result = extract_base_model(name)
+        remember_base_models([name], [result])
+    return result
+
+
+def remember_base_models(names, results):
+    if len(base_model_cache) + len(names) > BASE_MODEL_CACHE_SIZE:
+        base_model_cache.clear()
+    base_model_cache.update(zip(names, results))
+
+
+def parse_year(val: Any) -> Optional[int]:
+    return int(val) if isinstance(val, str) and val.isdecimal() else None
+
+
+def _unique_strings(values: Series) -> tuple:
+    """Коды и уникальные строковые значения: строковые операции выполняются один раз на значение"""
+    codes, uniques = pd.factorize(values)
+    return codes, Series(uniques, dtype="object").where(Series(uniques).map(type) == str)
+
+
+def _expand(codes: np.ndarray, results: Series, index: pd.Index) -> Series:
+    """Разворачивает результаты по уникальным значениям обратно в исходные строки (код -1 - пропуск)"""
+    values = results.to_numpy(dtype="object")
+    expanded = np.where(codes >= 0, values[codes] if len(values) else None, None)
+    return Series(expanded, index=index, dtype="object")
+
+
+def first_words(values: Series) -> Series:
+    """Первое слово каждого значения или NaN, если слов нет"""
+    codes, uniques = _unique_strings(values)
+    return _expand(codes, uniques.str.extract(FIRST_WORD_PATTERN, expand=False), values.index)
+
+
+def base_models(names: Series) -> Series:
+    """
+    Векторный extract_base_model. Считается только для названий, которых ещё нет в кэше,
+    поэтому при перезагрузке снимка разбираются лишь новые товары.
+    """
+    codes, uniques = _unique_strings(names)
+    missing = uniques[uniques.notna() & ~uniques.isin(base_model_cache.keys())]
+    if len(missing):
+        stripped = missing.str.replace(PARENTHESES_PATTERN, "", regex=True)
+        parsed = stripped.str.extract(BASE_MODEL_PATTERN, expand=False).str.split().str.join(" ")
+        parsed = parsed.where(parsed.str.len() > 0, stripped.str.strip())
+        remember_base_models(missing, parsed)
+    results = uniques.map(base_model_cache).fillna(UNKNOWN)
+    return _expand(codes, results, names.index).fillna(UNKNOWN)
+
+
+def brands(models: Series, names: Series) -> Series:
+    """Векторный extract_brand"""
+    return first_words(models).fillna(first_words(names)).fillna(UNKNOWN)
+
+
+def years(values: Series) -> Series:
+    """Векторный parse_year; пропуски - NaN"""
+    codes, uniques = _unique_strings(values)
+    digits = uniques.str.fullmatch(r"\d+", na=False).astype(bool)
+    parsed = Series(np.nan, index=uniques.index)
+    parsed[digits] = uniques[digits].map(int)
+    return _expand(codes, parsed, values.index).astype("float64")
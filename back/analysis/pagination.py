@@ -0,0 +1,100 @@
+import base64
+import binascii
+from typing import Iterator, Optional, Tuple
+import numpy as np
+
+
+DEFAULT_PAGE_SIZE = 100     # Товаров на странице, если limit не передан
+MAX_PAGE_SIZE = 1000        # Больше за один запрос не отдаётся
+STREAM_CHUNK_SIZE = 5000    # Строк, которые NDJSON-поток кодирует за один шаг
+
+SORT_COLUMNS = {"rating": "Рейтинг", "price": "Цена", "reviews": "Всего_отзывов", "id": "id"}  # Параметр sort → столбец
+SORT_ORDERS = ("desc", "asc")
+
+
+class CursorError(ValueError):
+    """Курсор повреждён или выдан для другой сортировки"""
+
+
+def encode_cursor(sort: str, order: str, key: float, product_id: int) -> str:
+    """
+    Курсор - последняя отданная позиция в порядке (ключ сортировки, id).
+    Следующая страница начинается строго после неё, поэтому перезагрузка снимка
+    между запросами не сдвигает страницы, как сдвинул бы offset.
+    """
+    raw = f"{sort}:{order}:{float(key)!r}:{int(product_id)}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str, order: str) -> Tuple[float, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        cursor_sort, cursor_order, key, product_id = raw.split(":")
+        key, product_id = float(key), int(product_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise CursorError("Invalid cursor")
+    if (cursor_sort, cursor_order) != (sort, order):
+        raise CursorError("Cursor was issued for a different sort")
+    return key, product_id
+
+
+def order_keys(values: np.ndarray, order: str) -> np.ndarray:
+    """
+    Ключи, по возрастанию которых идёт выдача: для desc значения берутся с минусом.
+    Пропуски получают +inf и всегда оказываются в конце.
+    """
+    keys = values.astype("float64", copy=True)
+    if order == "desc":
+        np.negative(keys, out=keys)
+    keys[np.isnan(keys)] = np.inf
+    return keys
+
+
+def top_k(keys: np.ndarray, ids: np.ndarray, k: int) -> np.ndarray:
+    """
+    Позиции k наименьших (ключ, id) по порядку.
+    argpartition отбирает их за O(n), полностью сортируются только кандидаты:
+    все строки с ключом не больше k-го, чтобы равные ключи упорядочились по id.
+    """
+    if k <= 0 or not len(keys):
+        return np.empty(0, dtype=np.intp)
+    if k < len(keys):
+        threshold = keys[np.argpartition(keys, k - 1)[k - 1]]
+        candidates = np.flatnonzero(keys <= threshold)
+    else:
+        candidates = np.arange(len(keys))
+    ordered = candidates[np.lexsort((ids[candidates], keys[candidates]))]
+    return ordered[:k]
+
+
+def page_positions(values: np.ndarray, ids: np.ndarray, order: str, limit: int,
+                   after: Optional[Tuple[float, int]] = None) -> Tuple[np.ndarray, Optional[Tuple[float, int]]]:
+    """
+    Позиции (в массивах values и ids) строк одной страницы и позиция,
+    после которой начнётся следующая (None - это последняя страница).
+    """
+    keys = order_keys(values, order)
+    candidates = np.arange(len(keys))
+    if after is not None:
+        after_key, after_id = after
+        candidates = np.flatnonzero((keys > after_key) | ((keys == after_key) & (ids > after_id)))
+        keys, ids = keys[candidates], ids[candidates]
+
+    # Одна лишняя строка показывает, есть ли следующая страница
+    selected = top_k(keys, ids, limit + 1)
+    page = selected[:limit]
+    following = None
+    if len(selected) > limit:
+        last = page[-1]
+        following = (float(keys[last]), int(ids[last]))
+    return candidates[page], following
+
+
+def sorted_positions(values: np.ndarray, ids: np.ndarray, order: str) -> np.ndarray:
+    """Все позиции в порядке выдачи - для потоковой отдачи целиком"""
+    return np.lexsort((ids, order_keys(values, order)))
+
+
+def chunks(positions: np.ndarray, size: int = STREAM_CHUNK_SIZE) -> Iterator[np.ndarray]:
+    for start in range(0, len(positions), size):
+        yield positions[start:start + size]
@@ -0,0 +1,40 @@
+from typing import Any
+import numpy as np
+import orjson
+import pandas as pd
+from pandas import DataFrame, Series
+
+
+# numpy-скаляры и массивы, ключи-числа; NaN и бесконечности orjson сам пишет как null
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def _default(value: Any) -> Any:
+    """То, что orjson не знает: pd.NA/NaT, Timestamp и скаляры pandas-расширений"""
+    if value is pd.NA or value is pd.NaT:
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Тип {type(value).__name__} не сериализуется в JSON")
+
+
+def to_json(obj: Any) -> bytes:
+    """Кодирует ответ в JSON-байты"""
+    return orjson.dumps(obj, default=_default, option=ORJSON_OPTIONS)
+
+
+def column_values(series: Series) -> list:
+    """
+    Столбец целиком в список значений Python: numpy-типы превращаются в int/float/str
+    одной операцией над массивом, пропуски - в None.
+    """
+    return series.to_numpy(dtype=object, na_value=None).tolist()
+
+
+def frame_records(df: DataFrame) -> list[dict]:
+    """DataFrame → список словарей без обхода каждой ячейки через isinstance"""
+    columns = [column_values(df[name]) for name in df.columns]
+    names = list(df.columns)
+    return [dict(zip(names, row)) for row in zip(*columns)]
@@ -1,33 +1,96 @@
 import asyncio
+import queue
+import threading
+from typing import AsyncIterator, Iterator, Optional
 import uvicorn
-from fastapi import FastAPI, Query
+from fastapi import FastAPI, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from contextlib import asynccontextmanager
 from analysis.dask_analyse import (get_info, get_count, get_avg, get_rate_devices, get_brand_info, get_product_by_id,
-                          get_products_by_category, get_brands_by_reviews)
-from database.couchdb_connector import fetch_and_save_to_parquet
+                          get_products_by_category, get_brands_by_reviews, cached_json, AVG_COLUMNS,
+                          get_rate_devices_page, get_products_by_category_page, stream_rate_devices,
+                          stream_products_by_category, sort_error)
+from analysis.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from analysis.serialization import to_json
+from api.executors import SUMMARIES_COMMAND, Overloaded, QueryPool, SubprocessJob
+from database.parquet_export import current_generation
+from model.batching import BatchingQueue
+from model.cache import ResponseCache
+from model.config import SYSTEM_MESSAGE
 from model.model import model
+from model.streaming import StreamCleaner
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+EXPORT_INTERVAL = 60    # Пауза между выгрузками, сек
+SUMMARY_RETRY_MAX = 3600    # Предельная пауза перед повтором упавшей генерации сводок, сек
+DATA_DIR = "./data"
+AI_STREAMS = 2          # Потоковых генераций в работе и в ожидании модели; её они делят с пачками /ai/
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+# Синхронные функции анализа выполняются здесь, а не в цикле событий
+query_pool = QueryPool()
+export_runner = SubprocessJob()
+summary_runner = SubprocessJob(SUMMARIES_COMMAND)
+# Одновременные запросы к модели объединяются в пачки, повторные берутся из кэша
+ai_cache = ResponseCache(adapter=model.adapter_fingerprint, config=model.config_hash, system_message=SYSTEM_MESSAGE)
+ai_batcher = BatchingQueue(model.generate_batch, cache=ai_cache)
+ai_stream_slots = threading.BoundedSemaphore(AI_STREAMS)
 
 
 async def background_analyze():
-    """Асинхронная функция для обновления parquet файла"""
+    """Асинхронная функция для обновления parquet файла; сама выгрузка идёт в отдельном процессе"""
     while True:
         try:
-            fetch_and_save_to_parquet()
+            await export_runner.run()
         except Exception as e:
             print(f"Ошибка при обновлении: {e}")
-        await asyncio.sleep(60)  # 1 минута
+        await asyncio.sleep(EXPORT_INTERVAL)
+
+
+async def background_summaries():
+    """
+    После каждой выгрузки, давшей новое поколение, модель дописывает сводки новых и изменившихся товаров.
+    Цикл отдельный, чтобы долгая генерация не задерживала следующие выгрузки.
+    После ошибки пауза удваивается до SUMMARY_RETRY_MAX, в том числе для новых поколений:
+    каждая попытка заново загружает SUMMARY_WORKERS копий модели.
+    """
+    summarized = None
+    retry_delay = EXPORT_INTERVAL
+    while True:
+        delay = EXPORT_INTERVAL
+        generation = current_generation(DATA_DIR)
+        if generation is not None and generation != summarized:
+            try:
+                await summary_runner.run()
+                summarized = generation
+                retry_delay = EXPORT_INTERVAL
+            except Exception as e:
+                print(f"Ошибка при генерации сводок: {e}, повтор через {retry_delay} с")
+                delay = retry_delay
+                retry_delay = min(retry_delay * 2, SUMMARY_RETRY_MAX)
+        await asyncio.sleep(delay)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Запускаем фоновую задачу при старте приложения
-    task = asyncio.create_task(background_analyze())
+    tasks = [asyncio.create_task(background_analyze()), asyncio.create_task(background_summaries())]
     yield
-    task.cancel()
+    for task in tasks:
+        task.cancel()
+    query_pool.shutdown()
+    export_runner.shutdown()
+    summary_runner.shutdown()
+    ai_batcher.close()
 
 app = FastAPI(lifespan=lifespan)
 
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    return JSONResponse(status_code=503, content={"error": f"Too many requests to '{exc}', try again later"})
+
 # Middleware можно использовать для создания сайта
 app.add_middleware(
     CORSMiddleware,
@@ -44,56 +107,203 @@ async def home():
         "http://localhost:8000/info": "Возвращает общую информацию о парсере",
         "http://localhost:8000/count": "Возвращает количество товаров по категории и количество устройств по брендам",
         "http://localhost:8000/rate-devices": "Возвращает рейтинг устройств",
+        "http://localhost:8000/rate-devices/page?limit={n}&cursor={cursor}&sort={key}&order={desc|asc}":
+            "Возвращает рейтинг устройств постранично",
+        "http://localhost:8000/rate-devices/stream?sort={key}&order={desc|asc}": "Отдаёт рейтинг устройств потоком NDJSON",
         "http://localhost:8000/avg/rate": "Возвращает средний рейтинг по категории, бренду и году",
         "http://localhost:8000/avg/price": "Возвращает среднюю цену по категории, бренду и году",
         "http://localhost:8000/brand_by_reviews": "Возвращает топ брендов по общему количеству отзывов",
         "http://localhost:8000/products/{product_id}": "Возвращает товар по id",
         "http://localhost:8000/products/category/{category_name}": "Возвращает все товары по категориям",
+        "http://localhost:8000/products/category/{category_name}/page?limit={n}&cursor={cursor}&sort={key}&order={asc|desc}":
+            "Возвращает товары категории постранично",
+        "http://localhost:8000/products/category/{category_name}/stream?sort={key}&order={asc|desc}":
+            "Отдаёт товары категории потоком NDJSON",
         "http://localhost:8000/brand/{brand_name}": "Возвращает статистику по бренду",
         "http://localhost:8000/ai/?q={prompt}": "Запрос к обученной модели",
+        "http://localhost:8000/ai/stream?q={prompt}": "Запрос к обученной модели с выдачей ответа по токенам (SSE)",
+        "http://localhost:8000/metrics": "Возвращает загрузку пула запросов по эндпоинтам, состояние выгрузки и очереди модели",
     }
 
 
+def json_response(body: bytes) -> Response:
+    """Готовые JSON-байты отдаются как есть, минуя кодировщик FastAPI"""
+    return Response(content=body, media_type="application/json")
+
+
+def encoded(func, *args, **kwargs) -> bytes:
+    """Ответ функции анализа сразу в JSON-байтах: кодирование тоже выполняется в пуле"""
+    return to_json(func(*args, **kwargs))
+
+
+def ndjson_response(sort: str, order: str, stream) -> Response:
+    """
+    Поток NDJSON; синхронный генератор Starlette обходит в пуле потоков, поэтому цикл событий не блокируется.
+    Параметры проверяются заранее: после начала потока вернуть ошибку уже нельзя.
+    """
+    error = sort_error(sort, order)
+    if error:
+        return json_response(to_json({"error": error}))
+    return StreamingResponse(stream(), media_type=NDJSON_MEDIA_TYPE)
+
+
 @app.get("/{param}")
 async def info(param: str):
     match param.lower():
         case "info":
-            return get_info()
+            return json_response(await query_pool.run("info", cached_json, get_info))
         case "count":
-            return get_count()
+            return json_response(await query_pool.run("count", cached_json, get_count))
         case "rate-devices":
-            return get_rate_devices()
+            return json_response(await query_pool.run("rate-devices", cached_json, get_rate_devices))
         case "brand_by_reviews":
-            return get_brands_by_reviews()
+            return json_response(await query_pool.run("brand_by_reviews", cached_json, get_brands_by_reviews))
+        case "metrics":
+            return {"query_pool": query_pool.stats(), "export": export_runner.stats(),
+                    "summaries": summary_runner.stats(), "ai": ai_batcher.stats(),
+                    "ai_cache": ai_cache.stats()}
         case _:
             return {"Error 404": "Not found"}
 
 
+@app.get("/rate-devices/page")
+async def rate_devices_page(limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), cursor: str | None = None,
+                            sort: str = "rating", order: str = "desc"):
+    return json_response(await query_pool.run("rate-devices/page", encoded, get_rate_devices_page,
+                                              limit=limit, cursor=cursor, sort=sort, order=order))
+
+
+@app.get("/rate-devices/stream")
+async def rate_devices_stream(sort: str = "rating", order: str = "desc"):
+    return ndjson_response(sort, order, lambda: stream_rate_devices(sort=sort, order=order))
+
+
 @app.get("/avg/{avg_param}")
 async def avg_rate(avg_param: str):
-    return get_avg(param=avg_param.lower())
+    param = avg_param.lower()
+    # Кэшируются только допустимые параметры, иначе ключи кэша задавал бы клиент
+    if param in AVG_COLUMNS:
+        return json_response(await query_pool.run("avg", cached_json, get_avg, param))
+    return json_response(to_json(get_avg(param=param)))
 
 
 @app.get("/products/{product_id}")
 async def products_by_id(product_id: int):
-    return get_product_by_id(product_id=int(product_id))
+    return json_response(await query_pool.run("products/id", encoded, get_product_by_id, product_id=int(product_id)))
 
 
 @app.get("/products/category/{category_name}")
 async def products_by_category(category_name: str):
-    return get_products_by_category(category_name=category_name)
+    return json_response(await query_pool.run("products/category", encoded, get_products_by_category,
+                                              category_name=category_name))
+
+
+@app.get("/products/category/{category_name}/page")
+async def products_by_category_page(category_name: str, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                                    cursor: str | None = None, sort: str = "id", order: str = "asc"):
+    return json_response(await query_pool.run("products/category/page", encoded, get_products_by_category_page,
+                                              category_name=category_name, limit=limit, cursor=cursor,
+                                              sort=sort, order=order))
+
+
+@app.get("/products/category/{category_name}/stream")
+async def products_by_category_stream(category_name: str, sort: str = "id", order: str = "asc"):
+    return ndjson_response(sort, order, lambda: stream_products_by_category(category_name, sort=sort, order=order))
 
 
 @app.get("/brand/{brand_name}")
 async def brand_stats(brand_name: str):
-    return get_brand_info(brand_name=brand_name)
+    return json_response(await query_pool.run("brand", encoded, get_brand_info, brand_name=brand_name))
 
 
 @app.get("/ai/")
 async def ai_assist(q: str = Query(..., description="Текстовый запрос к нейросети")):
-    response = model.generate(prompt=q)
+    try:
+        response = await ai_batcher.generate_async(q)
+    except queue.Full:
+        raise Overloaded("ai")
     return {"message": response}
 
 
+def sse_event(data: dict, event: Optional[str] = None) -> bytes:
+    """Одно событие Server-Sent Events с JSON в поле data"""
+    head = f"event: {event}\n".encode() if event else b""
+    return head + b"data: " + to_json(data) + b"\n\n"
+
+
+def ai_stream_events(q: str) -> Iterator[bytes]:
+    """
+    События потока /ai/stream: очищенный на лету текст ({"text": ...}) по мере генерации,
+    затем done с итоговым ответом cleanup_response ({"message": ...}), как у /ai/.
+    Слот берётся внутри генератора, чтобы он освобождался при любом завершении потока.
+    """
+    if not ai_stream_slots.acquire(blocking=False):
+        yield sse_event({"error": "Too many requests to 'ai/stream', try again later"}, "error")
+        return
+    try:
+        cached = ai_cache.get(q)
+        if cached is not None:
+            yield sse_event({"text": cached})
+            yield sse_event({"message": cached}, "done")
+            return
+
+        cleaner = StreamCleaner()
+        raw = []
+        # Генерация делит модель с пачками /ai/, уступая её каждые STREAM_CHUNK_TOKENS токенов
+        tokens = model.generate_stream(q, run=ai_batcher.call, checkpoint=ai_batcher.checkpoint)
+        try:
+            for chunk in tokens:
+                raw.append(chunk)
+                text = cleaner.feed(chunk)
+                if text:
+                    yield sse_event({"text": text})
+        finally:
+            # Клиент ушёл - генерация останавливается
+            tokens.close()
+        text = cleaner.finish()
+        if text:
+            yield sse_event({"text": text})
+
+        message = model.cleanup_response("".join(raw))
+        if message:
+            ai_cache.put(q, message)
+        yield sse_event({"message": message}, "done")
+    except Exception as e:
+        print(f"Ошибка потоковой генерации: {e}")
+        yield sse_event({"error": str(e)}, "error")
+    finally:
+        ai_stream_slots.release()
+
+
+async def ai_events(q: str) -> AsyncIterator[bytes]:
+    """
+    ai_stream_events по шагам в пуле потоков. Если клиент ушёл, Starlette отменяет задачу, но сам
+    синхронный генератор не закрывает - закрываем здесь, после текущего шага, чтобы остановить генерацию
+    и освободить слот. Ждать закрытия в отменённой задаче нельзя, поэтому оно уходит в пул без await.
+    """
+    events = ai_stream_events(q)
+    lock = threading.Lock()
+
+    def step() -> Optional[bytes]:
+        with lock:
+            return next(events, None)
+
+    def close():
+        with lock:
+            events.close()
+
+    loop = asyncio.get_running_loop()
+    try:
+        while (event := await loop.run_in_executor(None, step)) is not None:
+            yield event
+    finally:
+        loop.run_in_executor(None, close)
+
+
+@app.get("/ai/stream")
+async def ai_stream(q: str = Query(..., description="Текстовый запрос к нейросети")):
+    return StreamingResponse(ai_events(q), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
 def api_run():
     uvicorn.run(app, host="localhost", port=8000)
@@ -0,0 +1,183 @@
+import asyncio
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from time import monotonic
+from typing import Any, Callable, Optional
+
+
+QUERY_WORKERS = min(32, (os.cpu_count() or 1) + 4)    # Потоков для синхронных функций анализа
+DEFAULT_ENDPOINT_LIMIT = 8     # Одновременных вызовов одного эндпоинта, если он не указан в ENDPOINT_LIMITS
+ENDPOINT_LIMITS = {            # Тяжёлым эндпоинтам меньше слотов, чтобы они не заняли весь пул
+    "rate-devices": 2,
+    "products/category": 4,
+    "brand": 4,
+}
+MAX_QUEUE_DEPTH = 100          # Сколько запросов эндпоинта может ждать слота; остальным сразу 503
+
+BACK_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EXPORT_COMMAND = (sys.executable, "-m", "database.parquet_export")     # Выгрузка отдельным процессом
+SUMMARIES_COMMAND = (sys.executable, "-m", "model.summaries")          # Пакетная генерация сводок моделью
+
+
+class Overloaded(Exception):
+    """Очередь эндпоинта заполнена"""
+
+
+class EndpointLimiter:
+    """
+    Ограничивает число одновременных вызовов одного эндпоинта в пуле потоков и считает метрики:
+    сколько выполняется и ждёт сейчас, максимум очереди, среднее ожидание и время выполнения.
+    Все счётчики меняются только в потоке цикла событий, поэтому блокировки не нужны.
+    """
+
+    def __init__(self, name: str, limit: int, max_queue: int = MAX_QUEUE_DEPTH):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.semaphore = asyncio.Semaphore(limit)
+        self.active = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.wait_time = 0.0
+        self.run_time = 0.0
+
+    async def run(self, executor: ThreadPoolExecutor, func: Callable, *args, **kwargs) -> Any:
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise Overloaded(self.name)
+
+        queued = monotonic()
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        started = monotonic()
+        self.wait_time += started - queued
+        self.active += 1
+
+        loop = asyncio.get_running_loop()
+        try:
+            future = loop.run_in_executor(executor, partial(func, *args, **kwargs))
+        except BaseException:
+            self.active -= 1
+            self.semaphore.release()
+            raise
+        # Слот освобождается, когда поток действительно закончил, даже если клиент ушёл раньше
+        future.add_done_callback(partial(self._finished, started))
+        return await asyncio.shield(future)
+
+    def _finished(self, started: float, future: asyncio.Future):
+        self.active -= 1
+        self.completed += 1
+        self.run_time += monotonic() - started
+        if future.cancelled() or future.exception() is not None:
+            self.failed += 1
+        self.semaphore.release()
+
+    def stats(self) -> dict:
+        done = max(1, self.completed)
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "waiting": self.waiting,
+            "max_waiting": self.max_waiting,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self.wait_time / done * 1000, 3),
+            "avg_run_ms": round(self.run_time / done * 1000, 3),
+        }
+
+
+class QueryPool:
+    """Ограниченный пул потоков для синхронного кода pandas и лимиты по эндпоинтам поверх него"""
+
+    def __init__(self, workers: int = QUERY_WORKERS):
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="query")
+        self.limiters: dict[str, EndpointLimiter] = {}
+
+    def limiter(self, endpoint: str) -> EndpointLimiter:
+        limiter = self.limiters.get(endpoint)
+        if limiter is None:
+            limit = ENDPOINT_LIMITS.get(endpoint, DEFAULT_ENDPOINT_LIMIT)
+            limiter = self.limiters[endpoint] = EndpointLimiter(endpoint, limit)
+        return limiter
+
+    async def run(self, endpoint: str, func: Callable, *args, **kwargs) -> Any:
+        return await self.limiter(endpoint).run(self.executor, func, *args, **kwargs)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "endpoints": {name: limiter.stats() for name, limiter in sorted(self.limiters.items())},
+        }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class SubprocessJob:
+    """
+    Фоновая задача (выгрузка, генерация сводок) в отдельном процессе: она не занимает ни цикл событий, ни GIL
+    процесса API. Запускается как python -m <модуль>, а не через multiprocessing, чтобы дочерний процесс
+    не импортировал заново точку входа вместе с API и моделью.
+    """
+
+    def __init__(self, command: tuple = EXPORT_COMMAND):
+        self.command = command
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.runs = 0
+        self.failures = 0
+        self.last_started: Optional[str] = None
+        self.last_duration: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    async def run(self):
+        started = monotonic()
+        self.last_started = datetime.now().isoformat()
+        # Рабочий каталог тот же, что у API (относительные пути к данным совпадают), пакеты ищутся от back/
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [BACK_DIR, env.get("PYTHONPATH")]))
+        try:
+            self.process = await asyncio.create_subprocess_exec(*self.command, env=env, stderr=asyncio.subprocess.PIPE)
+            _, stderr = await self.process.communicate()
+            if self.process.returncode != 0:
+                lines = stderr.decode(errors="replace").strip().splitlines()
+                raise RuntimeError(lines[-1] if lines else f"код завершения {self.process.returncode}")
+            self.last_error = None
+        except asyncio.CancelledError:
+            self.shutdown()
+            raise
+        except Exception as e:
+            self.failures += 1
+            self.last_error = str(e)
+            raise
+        finally:
+            self.process = None
+            self.runs += 1
+            self.last_duration = round(monotonic() - started, 3)
+
+    def stats(self) -> dict:
+        return {
+            "running": self.process is not None,
+            "runs": self.runs,
+            "failures": self.failures,
+            "last_started": self.last_started,
+            "last_duration_s": self.last_duration,
+            "last_error": self.last_error,
+        }
+
+    def shutdown(self):
+        """Останавливает идущий процесс; недописанное поколение или файл сводок не станет текущим"""
+        process = self.process
+        if process is not None and process.returncode is None:
+            process.terminate()
@@ -0,0 +1,39 @@
+import os
+import tempfile
+from time import perf_counter
+
+from analysis import dask_analyse as da
+from benchmarks.synthetic import write_synthetic_generation
+
+
+def benchmark_lookups(sizes: tuple = (1_000, 10_000, 100_000), repeat: int = 200) -> dict:
+    """
+    Средняя задержка поиска по id, категории и бренду (мс) на каталогах разного размера.
+    С индексами она не должна расти вместе с каталогом.
+    """
+    results = {}
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as base_dir:
+            write_synthetic_generation(base_dir, size)
+            parquet_path = os.path.join(base_dir, "products.parquet")
+            snapshot = da.load_snapshot(parquet_path)
+            rows = snapshot.data.sample(repeat, replace=True, random_state=0)
+
+            timings = {}
+            for name, func, keys in (
+                ("id", da.get_product_by_id, rows["id"].tolist()),
+                ("category", da.get_products_by_category, rows["Категория"].tolist()),
+                ("brand", da.get_brand_info, rows["Бренд"].tolist()),
+            ):
+                started = perf_counter()
+                for key in keys:
+                    func(key, parquet_path)
+                timings[name] = round((perf_counter() - started) / repeat * 1000, 3)
+            results[size] = timings
+            da.snapshot_managers.pop(base_dir, None)
+    return results
+
+
+if __name__ == '__main__':
+    for size, timings in benchmark_lookups().items():
+        print(f"{size:>8} товаров: " + ", ".join(f"{name} {ms} мс" for name, ms in timings.items()))
@@ -0,0 +1,75 @@
+import json
+import os
+import tempfile
+from time import perf_counter
+from typing import Any, Callable
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from analysis import dask_analyse as da
+from analysis.serialization import frame_records, to_json
+from benchmarks.synthetic import write_synthetic_generation
+
+
+def legacy_records(df: DataFrame) -> list[dict]:
+    """Прежнее преобразование для сравнения: to_dict и проверка типа каждой ячейки"""
+    result = []
+    for item in df.to_dict(orient="records"):
+        clean_item = {}
+        for k, v in item.items():
+            if isinstance(v, (np.integer, np.int64, np.int32)):
+                clean_item[k] = int(v)
+            elif isinstance(v, (np.floating, np.float64, np.float32)):
+                clean_item[k] = float(v) if not pd.isna(v) else None
+            elif pd.isna(v):
+                clean_item[k] = None
+            else:
+                clean_item[k] = v
+        result.append(clean_item)
+    return result
+
+
+def legacy_json(obj: Any) -> bytes:
+    """Прежний путь FastAPI для возвращаемого словаря: jsonable_encoder + json.dumps"""
+    from fastapi.encoders import jsonable_encoder
+    return json.dumps(jsonable_encoder(obj), ensure_ascii=False).encode()
+
+
+def _mean_ms(func: Callable[[], Any], repeat: int) -> float:
+    func()
+    started = perf_counter()
+    for _ in range(repeat):
+        func()
+    return round((perf_counter() - started) / repeat * 1000, 3)
+
+
+def benchmark_serialization(size: int = 100_000, repeat: int = 5) -> dict:
+    """
+    Время кодирования ответов (мс) на синтетическом каталоге:
+    прежний путь (поячеечное преобразование + кодировщик FastAPI), orjson и закэшированные байты снимка.
+    """
+    with tempfile.TemporaryDirectory() as base_dir:
+        write_synthetic_generation(base_dir, size)
+        parquet_path = os.path.join(base_dir, "products.parquet")
+        devices = da.load_and_process_data(parquet_path)[["id", "Наименование", "Рейтинг", "Всего_отзывов", "Цена"]]
+        results = {
+            "список товаров": {
+                "прежний": _mean_ms(lambda: legacy_json(legacy_records(devices)), repeat),
+                "orjson": _mean_ms(lambda: to_json(frame_records(devices)), repeat),
+            }
+        }
+        for getter in (da.get_count, da.get_rate_devices):
+            results[getter.__name__] = {
+                "прежний": _mean_ms(lambda: legacy_json(getter(parquet_path)), repeat),
+                "orjson": _mean_ms(lambda: to_json(getter(parquet_path)), repeat),
+                "кэш": _mean_ms(lambda: da.cached_json(getter, parquet_path=parquet_path), repeat),
+            }
+        da.snapshot_managers.pop(base_dir, None)
+    return results
+
+
+if __name__ == '__main__':
+    for case, timings in benchmark_serialization().items():
+        print(f"{case:>16}: " + ", ".join(f"{label} {ms} мс" for label, ms in timings.items()))
@@ -0,0 +1,34 @@
+import os
+from datetime import datetime
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from database.parquet_export import GENERATION_FORMAT, PRODUCTS_SCHEMA, generation_dir, set_current_generation
+
+
+def write_synthetic_generation(base_dir: str, size: int):
+    """Синтетический каталог для замеров: около 100 товаров на категорию и 50 на бренд"""
+    ids = np.arange(size)
+    categories = [f"Категория {i}" for i in ids % max(1, size // 100)]
+    brand_ids = ids % max(1, size // 50)
+    names = [f"Бренд{b} Модель {i} 8/128 ГБ" for i, b in zip(ids, brand_ids)]
+    table = pa.table({
+        "id": ids,
+        "Категория": categories,
+        "Наименование": names,
+        "Цена": 1000 + ids,
+        "Рейтинг": (ids % 50 / 10).astype(str),
+        "Ссылка": [f"https://www.dns-shop.ru/product/{i}/" for i in ids],
+        "Описание": [""] * size,
+        "Всего_отзывов": ids % 7,
+        "Базовая_модель": [f"Бренд{b} Модель" for b in brand_ids],
+        "Бренд": [f"Бренд{b}" for b in brand_ids],
+        "Год": 2015 + ids % 10,
+    }, schema=PRODUCTS_SCHEMA)
+    generation = datetime.now().strftime(GENERATION_FORMAT)
+    products_path = os.path.join(generation_dir(base_dir, generation), "products_main")
+    os.makedirs(products_path)
+    pq.write_table(table, os.path.join(products_path, "synthetic.parquet"))
+    set_current_generation(base_dir, generation)
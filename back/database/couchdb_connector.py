@@ -1,13 +1,14 @@
 import sys
-import os
 import re
+import json
 import subprocess
 import hashlib
+from time import monotonic
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, Optional
 import couchdb
-import pyarrow as pa
-import pyarrow.parquet as pq
-import pandas as pd
-from database.mongodb_connector import is_docker_running, container_exists, create_connection
+from database.mongodb_connector import (is_docker_running, container_exists, create_connection, flush_data,
+                                        ensure_sync_index)
 
 
 COUCHDB_HOST = "localhost"
@@ -15,6 +16,14 @@ COUCHDB_PORT = 5984
 COUCHDB_USER = "admin"
 COUCHDB_PASSWORD = "secret"
 DATABASE_NAME = "tech_analytics"
+SYNC_BATCH_SIZE = 500               # Документов в одном запросе _bulk_docs
+SYNC_STATE_PATH = ["_local", "mongo_sync"]   # Локальный документ с отметкой синхронизации
+SYNC_OVERLAP = timedelta(seconds=60)         # Запас на записи, ещё не видимые в момент чтения
+EXPORT_BATCH_SIZE = 5000            # Документов в одном запросе _all_docs при выгрузке
+# Служебные поля, не входящие в хеш содержимого: ревизия и отметка меняются и без изменения данных
+HASH_EXCLUDED_FIELDS = ("_id", "_rev", "updated_at", "content_hash")
+SYNC_DESIGN_ID = "_design/sync"     # Представление ревизий и хешей для сверки перед записью
+REVISIONS_VIEW = "sync/revisions"
 
 
 def start_couchdb():
@@ -127,6 +136,12 @@ def generate_doc_id(url: str) -> str:
     return "product_data" + hashlib.md5(url.encode()).hexdigest()
 
 
+def content_hash(doc: dict) -> str:
+    """md5 содержимого документа без служебных полей; не зависит от порядка ключей"""
+    content = {key: value for key, value in doc.items() if key not in HASH_EXCLUDED_FIELDS}
+    return hashlib.md5(json.dumps(content, sort_keys=True, ensure_ascii=False, default=str).encode()).hexdigest()
+
+
 def insert_data(document: dict):
     """
     Вставляет документ в CouchDB.
@@ -143,6 +158,7 @@ def insert_data(document: dict):
     # Очищаем пустые отзывы
     cleaned_doc = remove_empty_reviews(document)
     cleaned_doc["_id"] = doc_id  # CouchDB требует _id
+    cleaned_doc["content_hash"] = content_hash(cleaned_doc)
 
     try:
         # Пытаемся получить существующий документ
@@ -161,8 +177,7 @@ def show_data():
     """Показывает все документы в базе"""
     db = get_or_create_database()
     count = 0
-    for doc_id in db:
-        doc = db[doc_id]
+    for doc in iter_all_docs(db):
         print(doc)
         count += 1
     print(f'Количество документов: {count}')
@@ -176,113 +191,173 @@ def clear_data():
     print("База данных очищена.")
 
 
+def get_sync_watermark(db) -> Optional[datetime]:
+    """Время последнего перенесённого из Mongo изменения"""
+    try:
+        _, _, state = db.resource.get_json(SYNC_STATE_PATH)
+    except couchdb.ResourceNotFound:
+        return None
+    return datetime.fromisoformat(state["watermark"])
+
+
+def set_sync_watermark(db, watermark: datetime):
+    try:
+        _, _, state = db.resource.get_json(SYNC_STATE_PATH)
+    except couchdb.ResourceNotFound:
+        state = {}
+    state["watermark"] = watermark.isoformat()
+    db.resource.put_json(SYNC_STATE_PATH, body=state)
+
+
+def document_timestamp(doc: dict) -> datetime:
+    """Время изменения документа Mongo: поле updated_at или, если его ещё нет, время создания из ObjectId"""
+    updated_at = doc.get("updated_at")
+    if isinstance(updated_at, datetime):
+        return updated_at if updated_at.tzinfo else updated_at.replace(tzinfo=timezone.utc)
+    return doc["_id"].generation_time
+
+
+def to_couch_document(doc: dict) -> Optional[dict]:
+    """Готовит документ Mongo к записи в CouchDB"""
+    url = (doc.get("Ссылка") or "").strip()
+    if not url:
+        return None
+    cleaned_doc = remove_empty_reviews(doc)
+    if isinstance(cleaned_doc.get("updated_at"), datetime):
+        cleaned_doc["updated_at"] = cleaned_doc["updated_at"].isoformat()
+    cleaned_doc["_id"] = generate_doc_id(url)
+    cleaned_doc["content_hash"] = content_hash(cleaned_doc)
+    return cleaned_doc
+
+
+def ensure_revisions_view(db):
+    """Создаёт представление {_id: [_rev, content_hash]}, если его ещё нет"""
+    if SYNC_DESIGN_ID in db:
+        return
+    db.save({
+        "_id": SYNC_DESIGN_ID,
+        "views": {"revisions": {"map": "function (doc) { emit(doc._id, [doc._rev, doc.content_hash || null]); }"}},
+    })
+
+
+def bulk_save(db, documents: list[dict]) -> tuple[int, int]:
+    """
+    Записывает пачку документов одним запросом _bulk_docs.
+    Текущие ревизии и хеши содержимого всей пачки получает одним запросом к REVISIONS_VIEW;
+    документы с тем же хешем не перезаписываются, чтобы их ревизия не менялась.
+    Возвращает количество записанных и неудачных записей.
+    """
+    stored = {row.id: row.value for row in db.view(REVISIONS_VIEW, keys=[doc["_id"] for doc in documents])}
+
+    changed = []
+    for doc in documents:
+        if doc["_id"] not in stored:
+            changed.append(doc)
+            continue
+        rev, stored_hash = stored[doc["_id"]]
+        if stored_hash != doc["content_hash"]:
+            doc["_rev"] = rev
+            changed.append(doc)
+    if not changed:
+        return 0, 0
+
+    failed = 0
+    for success, doc_id, error in db.update(changed):
+        if not success:
+            failed += 1
+            print(f"Не удалось записать {doc_id}: {error}")
+    return len(changed) - failed, failed
+
+
 def mongo_to_couch():
-    """Создает соединение и перебрасывает данные между Mongo и Couch"""
-    # Вытаскиваем данные из MongoDB
+    """
+    Переносит в CouchDB только документы Mongo, изменённые с прошлой синхронизации.
+    Отметка времени хранится в локальном документе CouchDB и сдвигается,
+    только если все пачки записались без ошибок.
+    """
+    # Вытаскиваем данные из MongoDB, дописав буфер пакетной записи
+    flush_data()
+    ensure_sync_index()
     mongo_collection = create_connection()
-    mongo_documents = mongo_collection.find()
-    # Закидываем документы из Mongo в Couch
-    for doc in mongo_documents:
-        insert_data(doc)
+    db = get_or_create_database()
+    ensure_revisions_view(db)
+
+    watermark = get_sync_watermark(db)
+    started = datetime.now(timezone.utc)
+    # $gte: документы, записанные в ту же миллисекунду, безопаснее перенести повторно
+    query = {} if watermark is None else {"updated_at": {"$gte": watermark}}
+
+    new_watermark = watermark
+    synced = 0
+    failed = 0
+    batch = []
+    read = 0
+    for doc in mongo_collection.find(query).batch_size(SYNC_BATCH_SIZE):
+        read += 1
+        timestamp = document_timestamp(doc)
+        new_watermark = timestamp if new_watermark is None else max(new_watermark, timestamp)
+        couch_doc = to_couch_document(doc)
+        if couch_doc is not None:
+            batch.append(couch_doc)
+        if len(batch) >= SYNC_BATCH_SIZE:
+            saved, errors = bulk_save(db, batch)
+            synced += saved
+            failed += errors
+            batch = []
+    if batch:
+        saved, errors = bulk_save(db, batch)
+        synced += saved
+        failed += errors
+
+    if failed == 0 and new_watermark is not None:
+        # Документ с более ранней отметкой мог записаться уже после того, как курсор прошёл его место,
+        # поэтому отметка не уходит дальше начала синхронизации минус запас
+        new_watermark = min(new_watermark, started - SYNC_OVERLAP)
+        if watermark is None or new_watermark > watermark:
+            set_sync_watermark(db, new_watermark)
+    print(f"Синхронизировано документов: {synced} из {read} прочитанных, ошибок: {failed}")
+
+
+def iter_all_docs(db, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[dict]:
+    """
+    Постранично читает все документы через _all_docs?include_docs=true.
+    В памяти одновременно держится только одна страница из batch_size документов.
+    """
+    started = monotonic()
+    count = 0
+    for row in db.iterview("_all_docs", batch_size, include_docs=True):
+        if row.id.startswith("_design/") or row.doc is None:
+            continue
+        count += 1
+        yield dict(row.doc)
+    elapsed = monotonic() - started
+    print(f"Прочитано документов: {count} за {elapsed:.1f} с ({count / elapsed if elapsed else 0:.0f} док/с)")
 
 
-def fetch_and_save_to_parquet(OUTPUT_DIR='./data'):
-    """Основная функция: загрузка → очистка → сохранение."""
-    print("Подключение к CouchDB...")
-    db = get_or_create_database()
+def iter_docs_by_ids(db, ids: list[str], batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[dict]:
+    """Читает только указанные документы пачками через _all_docs?keys=...; удалённые пропускает"""
+    for start in range(0, len(ids), batch_size):
+        for row in db.view("_all_docs", keys=ids[start:start + batch_size], include_docs=True):
+            if row.doc is not None:
+                yield dict(row.doc)
 
-    print("Загрузка всех документов...")
-    docs = []
-    for doc_id in db:
-        doc = db[doc_id]
-        # Убираем служебные поля CouchDB
-        doc.pop('_id', None)
-        doc.pop('_rev', None)
-        docs.append(doc)
-
-    if not docs:
-        print("Нет данных в CouchDB.")
-        return
 
-    print(f"Очистка пустых отзывов у {len(docs)} товаров...")
-    cleaned_docs = [remove_empty_reviews(doc) for doc in docs]
-
-    # Добавляем числовой id
-    for i, doc in enumerate(cleaned_docs, start=1):
-        doc["id"] = i
-
-    df = pd.DataFrame(cleaned_docs)
-
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
-
-    product_cols = [
-        "id", "Категория", "Наименование", "Цена", "Рейтинг",
-        "Ссылка", "Описание", "Всего_отзывов"
-    ]
-    for col in product_cols:
-        if col not in df.columns:
-            df[col] = None
-    products_df = df[product_cols].copy()
-    products_df.to_parquet(os.path.join(OUTPUT_DIR, "products_main.parquet"), index=False)
-
-    specs_records = []
-    for _, row in df.iterrows():
-        char = row.get("Характеристики", {})
-        if isinstance(char, dict):
-            for key, value in char.items():
-                specs_records.append({
-                    "product_id": row["id"],
-                    "key": key,
-                    "value": str(value) if value is not None else ""
-                })
-
-    if specs_records:
-        specs_df = pd.DataFrame(specs_records)
-        specs_df.to_parquet(os.path.join(OUTPUT_DIR, "specs.parquet"), index=False)
-    else:
-        schema = pa.schema([
-            ("product_id", pa.int64()),
-            ("key", pa.string()),
-            ("value", pa.string())
-        ])
-        pq.write_table(pa.table([], schema=schema), os.path.join(OUTPUT_DIR, "specs.parquet"))
-
-    review_records = []
-    for _, row in df.iterrows():
-        reviews = row.get("Отзывы", [])
-        if isinstance(reviews, list):
-            for rev in reviews:
-                if isinstance(rev, dict):
-                    review_records.append({
-                        "product_id": row["id"],
-                        "Автор": str(rev.get("Автор", "")),
-                        "Дата": str(rev.get("Дата", "")),
-                        "Реальный покупатель": bool(rev.get("Реальный покупатель", False)),
-                        "Общий рейтинг": int(rev.get("Общий рейтинг", 0)),
-                        "Срок использования": str(rev.get("Срок использования", "")),
-                        "Достоинства": str(rev.get("Достоинства", "")),
-                        "Недостатки": str(rev.get("Недостатки", "")),
-                        "Комментарий": str(rev.get("Комментарий", ""))
-                    })
-
-    if review_records:
-        reviews_df = pd.DataFrame(review_records)
-        reviews_df.to_parquet(os.path.join(OUTPUT_DIR, "reviews.parquet"), index=False)
-    else:
-        schema = pa.schema([
-            ("product_id", pa.int64()),
-            ("Автор", pa.string()),
-            ("Дата", pa.string()),
-            ("Реальный покупатель", pa.bool_()),
-            ("Общий рейтинг", pa.int64()),
-            ("Срок использования", pa.string()),
-            ("Достоинства", pa.string()),
-            ("Недостатки", pa.string()),
-            ("Комментарий", pa.string())
-        ])
-        pq.write_table(pa.table([], schema=schema), os.path.join(OUTPUT_DIR, "reviews.parquet"))
-
-    print(f"Сохранено {len(df)} товаров в {OUTPUT_DIR}/")
+def iter_doc_fields(db, fields: list[str], batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[dict]:
+    """
+    Постранично читает только указанные поля всех документов через Mango _find,
+    не передавая по сети тяжёлые характеристики и отзывы.
+    """
+    bookmark = None
+    while True:
+        body = {"selector": {"_id": {"$gt": None}}, "fields": fields, "limit": batch_size}
+        if bookmark:
+            body["bookmark"] = bookmark
+        _, _, result = db.resource.post_json("_find", body=body)
+        docs = result.get("docs", [])
+        yield from docs
+        if len(docs) < batch_size:
+            break
+        bookmark = result.get("bookmark")
 
 
 if __name__ == '__main__':
@@ -1,14 +1,28 @@
 import sys
 import json
+import atexit
+import threading
 import subprocess
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure
+from time import monotonic
+from datetime import datetime, timezone
+from typing import Iterator, Optional
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import ConnectionFailure, OperationFailure, BulkWriteError, PyMongoError
 
 
 MONGO_HOST = "localhost"
 MONGO_PORT = 27017
 MONGO_USERNAME = "admin"
 MONGO_PASSWORD = "secret"
+MONGO_POOL_SIZE = 50        # Максимум соединений в общем пуле клиента
+
+BULK_SIZE = 100             # Сколько документов копить перед записью
+BULK_INTERVAL = 5.0         # Максимальное время документа в буфере, сек
+MAX_BUFFERED = 10 * BULK_SIZE   # Сверх этого add ждёт, пока MongoDB снова примет запись
+RETRY_INTERVAL = 10.0       # Пауза перед повторной записью после ошибки MongoDB, сек
+
+_client: Optional[MongoClient] = None
+_client_lock = threading.Lock()
 
 
 def is_docker_running() -> bool:
@@ -57,27 +71,160 @@ def start_mongodb():
             sys.exit(1)
 
 
+def get_client() -> MongoClient:
+    """Возвращает общий для всего процесса клиент MongoDB с пулом соединений"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                connection_string = (f"mongodb://{MONGO_USERNAME}:{MONGO_PASSWORD}@{MONGO_HOST}:{MONGO_PORT}"
+                                     f"/?authSource=admin")
+                client = MongoClient(connection_string, serverSelectionTimeoutMS=2000,
+                                     maxPoolSize=MONGO_POOL_SIZE)
+                # Доступность сервера проверяется один раз, а не перед каждым запросом
+                client.admin.command('ping')
+                _client = client
+    return _client
+
+
+def get_collection():
+    """Коллекция товаров; ошибки подключения пробрасываются"""
+    return get_client()["tech_analytics"]["products"]
+
+
 def create_connection():
-    """Создает подключение к MongoDB и возвращает коллекцию"""
-    global MONGO_HOST, MONGO_PORT, MONGO_USERNAME, MONGO_PASSWORD
-    connection_string = f"mongodb://{MONGO_USERNAME}:{MONGO_PASSWORD}@{MONGO_HOST}:{MONGO_PORT}/?authSource=admin"
+    """Возвращает коллекцию, используя общий пул соединений"""
     try:
-        client = MongoClient(connection_string, serverSelectionTimeoutMS=2000)
-        client.admin.command('ping')
+        return get_collection()
     except ConnectionFailure as e:
         print(f"Ошибка подключения: {e}")
         exit(1)
-    db = client["tech_analytics"]
-    collection = db["products"]
 
-    return collection
+
+class BufferedWriter:
+    """
+    Копит документы и пишет их пачками через bulk_write.
+    Каждый документ - upsert по "Ссылка", поэтому повторный парсинг обновляет запись, а не дублирует.
+    Буфер сбрасывается при накоплении BULK_SIZE документов, раз в BULK_INTERVAL секунд
+    и при завершении процесса. Если MongoDB недоступна, пачка возвращается в начало буфера
+    (задачи фронтира по этим товарам уже закрыты), а следующая попытка будет не раньше чем
+    через RETRY_INTERVAL. Когда в буфере max_buffered документов, add блокирует парсер до записи.
+    """
+
+    def __init__(self, batch_size: int = BULK_SIZE, flush_interval: float = BULK_INTERVAL,
+                 max_buffered: int = MAX_BUFFERED, retry_interval: float = RETRY_INTERVAL):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffered = max(batch_size, max_buffered)
+        self.retry_interval = retry_interval
+        self.retry_at = 0.0         # До этого момента (monotonic) запись не повторяем
+        self.buffer: list[dict] = []
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.written = 0
+        self.write_time = 0.0
+        self.stopped = threading.Event()
+        self.timer = threading.Thread(target=self._flush_periodically, name="mongo-writer", daemon=True)
+        self.timer.start()
+        atexit.register(self.close)
+
+    def _flush_periodically(self):
+        while not self.stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                # Поток сброса по времени не должен умирать до конца процесса
+                print(f"Ошибка сброса буфера: {e}")
+
+    def add(self, document: dict):
+        url = (document.get("Ссылка") or "").strip()
+        if not url:
+            print("Пропущен документ без ссылки.")
+            return
+        document["Ссылка"] = url
+        waiting = False
+        while True:
+            with self.lock:
+                if len(self.buffer) < self.max_buffered:
+                    self.buffer.append(document)
+                    full = len(self.buffer) >= self.batch_size
+                    break
+            # Буфер полон, пока MongoDB недоступна: парсер ждёт, а не копит документы без предела
+            if not waiting:
+                print(f"Буфер записи заполнен ({self.max_buffered} документов), ждём MongoDB")
+                waiting = True
+            self.flush()
+            if self.stopped.wait(max(0.1, self.retry_at - monotonic())):
+                raise RuntimeError("Запись в MongoDB остановлена")
+        if full:
+            self.flush()
+
+    def flush(self, force: bool = False):
+        """Записывает всё накопленное одним bulk_write; после ошибки - не чаще раза в retry_interval"""
+        with self.flush_lock:
+            if not force and monotonic() < self.retry_at:
+                return
+            with self.lock:
+                batch, self.buffer = self.buffer, []
+            if not batch:
+                return
+            started = monotonic()
+            # updated_at - отметка для инкрементальной синхронизации с CouchDB
+            updated_at = datetime.now(timezone.utc)
+            requests = [
+                UpdateOne({"Ссылка": doc["Ссылка"]}, {"$set": {**doc, "updated_at": updated_at}}, upsert=True)
+                for doc in batch
+            ]
+            try:
+                get_collection().bulk_write(requests, ordered=False)
+            except BulkWriteError as e:
+                # Остальные документы пачки записаны, отклонённые повторять бессмысленно
+                print(f"Ошибка пакетной записи: {e.details.get('writeErrors', [])[:3]}")
+            except PyMongoError as e:
+                with self.lock:
+                    self.buffer[:0] = batch
+                self.retry_at = monotonic() + self.retry_interval
+                print(f"MongoDB недоступна, {len(batch)} документов остаются в буфере: {e}")
+                return
+            self.retry_at = 0.0
+            self.write_time += monotonic() - started
+            self.written += len(batch)
+            print(f"Записано документов: {len(batch)} (всего {self.written}, "
+                  f"{self.throughput():.1f} док/с)")
+
+    def throughput(self) -> float:
+        """Скорость записи, документов в секунду времени, проведённого в bulk_write"""
+        return self.written / self.write_time if self.write_time else 0.0
+
+    def close(self):
+        self.stopped.set()
+        self.flush(force=True)
+        if self.buffer:
+            print(f"Не записано документов при завершении: {len(self.buffer)}")
+
+
+# Создаётся при первой записи: API, выгрузка и генерация сводок импортируют модуль только для чтения
+_writer: Optional[BufferedWriter] = None
+
+
+def get_writer() -> BufferedWriter:
+    global _writer
+    if _writer is None:
+        with _client_lock:
+            if _writer is None:
+                _writer = BufferedWriter()
+    return _writer
 
 
 def insert_data(document):
-    """Вставляет значения"""
-    collection = create_connection()
-    collection.insert_one(document)
-    print('Документ вставлен успешно.')
+    """Добавляет документ в буфер пакетной записи"""
+    get_writer().add(document)
+
+
+def flush_data():
+    """Принудительно записывает буфер (например, перед чтением коллекции)"""
+    if _writer is not None:
+        _writer.flush()
 
 
 def show_data():
@@ -110,6 +257,54 @@ def check_data(url: str):
         return True
 
 
+def ensure_url_index():
+    """Создаёт уникальный индекс по ссылке, на который опирается проверка дублей"""
+    collection = create_connection()
+    try:
+        collection.create_index("Ссылка", unique=True, name="url_unique")
+    except OperationFailure as e:
+        # В старых данных могут быть дубли - тогда хотя бы обычный индекс
+        print(f"Не удалось создать уникальный индекс по ссылке: {e}")
+        collection.create_index("Ссылка", name="url")
+
+
+def ensure_sync_index():
+    """
+    Индекс по updated_at для инкрементальной синхронизации с CouchDB.
+    Старым документам без отметки проставляется время создания из ObjectId,
+    чтобы синхронизация обходилась одним диапазонным запросом по индексу.
+    """
+    collection = create_connection()
+    collection.create_index("updated_at", name="updated_at")
+    # {updated_at: null} находит и документы без поля, используя тот же индекс
+    result = collection.update_many({"updated_at": None}, [{"$set": {"updated_at": {"$toDate": "$_id"}}}])
+    if result.modified_count:
+        print(f"Проставлена отметка updated_at старым документам: {result.modified_count}")
+
+
+def count_data() -> int:
+    """Быстрая оценка количества документов по метаданным коллекции"""
+    return create_connection().estimated_document_count()
+
+
+def load_known_urls() -> Iterator[str]:
+    """Отдаёт ссылки всех товаров в бд, читая только индекс"""
+    collection = create_connection()
+    for doc in collection.find({}, {"Ссылка": 1, "_id": 0}).batch_size(10000):
+        url = doc.get("Ссылка")
+        if url:
+            yield url
+
+
+def find_existing_urls(urls: list[str]) -> set[str]:
+    """Возвращает те ссылки из списка, что уже есть в бд, одним запросом $in"""
+    if not urls:
+        return set()
+    collection = create_connection()
+    found = collection.find({"Ссылка": {"$in": [url.strip() for url in urls]}}, {"Ссылка": 1, "_id": 0})
+    return {doc["Ссылка"] for doc in found}
+
+
 def export_data(filename="products.json"):
     """Записывает все документы в JSON файл без _id"""
     collection = create_connection()
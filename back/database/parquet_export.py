@@ -0,0 +1,378 @@
+import os
+import json
+import shutil
+import hashlib
+from datetime import datetime
+from typing import Any, Optional
+import pyarrow as pa
+import pyarrow.parquet as pq
+from database.couchdb_connector import get_or_create_database, iter_docs_by_ids, iter_doc_fields, remove_empty_reviews
+from analysis.derived_fields import cached_base_model, extract_brand, parse_year
+
+
+# Каждая выгрузка - отдельное поколение generations/<имя>/ с каталогом на таблицу
+# и одним parquet-файлом на категорию. Файл CURRENT указывает на готовое поколение.
+TABLES = ("products_main", "specs", "reviews")
+MANIFEST_NAME = "manifest.json"
+GENERATIONS_DIR = "generations"
+CURRENT_NAME = "CURRENT"
+SUMMARIES_NAME = "summaries.parquet"    # Сводки модели по товарам; лежат вне поколений и переживают их
+KEEP_GENERATIONS = 3            # Сколько последних поколений хранить (старые ещё могут дочитываться)
+GENERATION_FORMAT = "%Y%m%d%H%M%S%f"    # Имя поколения - время выгрузки
+# Версия формата партиций: при её смене все категории перезаписываются, даже без изменений в данных
+EXPORT_VERSION = 2
+UNKNOWN_CATEGORY = "Не указана"
+ROW_GROUP_SIZE = 10000          # Строк в одном row group; столько же держится в памяти на таблицу
+
+PRODUCTS_SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("Категория", pa.string()),
+    ("Наименование", pa.string()),
+    ("Цена", pa.int64()),
+    ("Рейтинг", pa.string()),
+    ("Ссылка", pa.string()),
+    ("Описание", pa.string()),
+    ("Всего_отзывов", pa.int64()),
+    # Производные поля считаются при выгрузке, чтобы не разбирать названия при каждой загрузке
+    ("Базовая_модель", pa.string()),
+    ("Бренд", pa.string()),
+    ("Год", pa.int64()),
+])
+
+SPECS_SCHEMA = pa.schema([
+    ("product_id", pa.int64()),
+    ("key", pa.string()),
+    ("value", pa.string()),
+])
+
+REVIEWS_SCHEMA = pa.schema([
+    ("product_id", pa.int64()),
+    ("Автор", pa.string()),
+    ("Дата", pa.string()),
+    ("Реальный покупатель", pa.bool_()),
+    ("Общий рейтинг", pa.int64()),
+    ("Срок использования", pa.string()),
+    ("Достоинства", pa.string()),
+    ("Недостатки", pa.string()),
+    ("Комментарий", pa.string()),
+])
+
+SUMMARIES_SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("summary", pa.string()),
+    # По хешу входа и версии модели видно, какие сводки устарели
+    ("input_hash", pa.string()),
+    ("model_version", pa.string()),
+    ("generated_at", pa.string()),
+])
+
+
+def generate_product_id(url: str) -> int:
+    """
+    Стабильный числовой id товара из его ссылки (тот же md5, что и в generate_doc_id).
+    52 бита - чтобы id без потерь помещался в Number на фронтенде.
+    """
+    return int(hashlib.md5(url.encode()).hexdigest()[:13], 16)
+
+
+def partition_name(category: str) -> str:
+    """Имя файла партиции: категории бывают с символами, недопустимыми в путях"""
+    return "category_" + hashlib.md5(category.encode()).hexdigest()[:12]
+
+
+def _int(value: Any) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _str(value: Any) -> Optional[str]:
+    return None if value is None else str(value)
+
+
+class ColumnBuffer:
+    """
+    Накапливает строки таблицы сразу по столбцам и сбрасывает их в ParquetWriter
+    отдельными row group, как только набирается batch_size строк.
+    """
+
+    def __init__(self, path: str, schema: pa.Schema, batch_size: int = ROW_GROUP_SIZE):
+        self.path = path
+        self.schema = schema
+        self.batch_size = batch_size
+        self.columns: list[list] = [[] for _ in schema]
+        self.writer = pq.ParquetWriter(path, schema)
+
+    def append(self, row: tuple):
+        """Добавляет строку; значения идут в порядке полей схемы"""
+        for column, value in zip(self.columns, row):
+            column.append(value)
+        if len(self.columns[0]) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.columns[0]:
+            return
+        arrays = [pa.array(column, type=field.type) for column, field in zip(self.columns, self.schema)]
+        self.writer.write_batch(pa.record_batch(arrays, schema=self.schema))
+        self.columns = [[] for _ in self.schema]
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+    def abort(self):
+        self.writer.close()
+        os.remove(self.path)
+
+
+class PartitionWriter:
+    """Потоковая запись трёх файлов одной категории"""
+
+    def __init__(self, output_dir: str, part: str):
+        self.products = ColumnBuffer(os.path.join(output_dir, "products_main", part + ".parquet"), PRODUCTS_SCHEMA)
+        self.specs = ColumnBuffer(os.path.join(output_dir, "specs", part + ".parquet"), SPECS_SCHEMA)
+        self.reviews = ColumnBuffer(os.path.join(output_dir, "reviews", part + ".parquet"), REVIEWS_SCHEMA)
+
+    def add(self, doc: dict):
+        doc = remove_empty_reviews(doc)
+        product_id = generate_product_id(doc["Ссылка"])
+        char = doc.get("Характеристики", {})
+        if not isinstance(char, dict):
+            char = {}
+        specs = {key: str(value) if value is not None else "" for key, value in char.items()}
+        name = _str(doc.get("Наименование"))
+        self.products.append((
+            product_id,
+            _str(doc.get("Категория")),
+            name,
+            _int(doc.get("Цена")),
+            _str(doc.get("Рейтинг")),
+            _str(doc.get("Ссылка")),
+            _str(doc.get("Описание")),
+            _int(doc.get("Всего_отзывов")),
+            cached_base_model(name),
+            extract_brand(specs.get("Модель"), name),
+            parse_year(specs.get("Год релиза")),
+        ))
+
+        for key, value in specs.items():
+            self.specs.append((product_id, key, value))
+
+        reviews = doc.get("Отзывы", [])
+        if isinstance(reviews, list):
+            for rev in reviews:
+                if isinstance(rev, dict):
+                    self.reviews.append((
+                        product_id,
+                        str(rev.get("Автор", "")),
+                        str(rev.get("Дата", "")),
+                        bool(rev.get("Реальный покупатель", False)),
+                        int(rev.get("Общий рейтинг", 0)),
+                        str(rev.get("Срок использования", "")),
+                        str(rev.get("Достоинства", "")),
+                        str(rev.get("Недостатки", "")),
+                        str(rev.get("Комментарий", "")),
+                    ))
+
+    def close(self):
+        for buffer in (self.products, self.specs, self.reviews):
+            buffer.close()
+
+    def abort(self):
+        for buffer in (self.products, self.specs, self.reviews):
+            buffer.abort()
+
+
+def partition_exists(generation_path: Optional[str], part: str) -> bool:
+    if generation_path is None:
+        return False
+    return all(os.path.exists(os.path.join(generation_path, table_name, part + ".parquet")) for table_name in TABLES)
+
+
+def link_partition(source_dir: str, target_dir: str, part: str):
+    """Переносит неизменённую партицию в новое поколение жёсткими ссылками, без копирования данных"""
+    for table_name in TABLES:
+        source = os.path.join(source_dir, table_name, part + ".parquet")
+        target = os.path.join(target_dir, table_name, part + ".parquet")
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copy2(source, target)
+
+
+def current_generation(output_dir: str) -> Optional[str]:
+    """Имя текущего поколения из файла-указателя или None, если выгрузок ещё не было"""
+    try:
+        with open(os.path.join(output_dir, CURRENT_NAME), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def generation_dir(output_dir: str, generation: str) -> str:
+    return os.path.join(output_dir, GENERATIONS_DIR, generation)
+
+
+def set_current_generation(output_dir: str, generation: str):
+    """Атомарно переключает указатель: читатели видят либо старое, либо новое поколение целиком"""
+    path = os.path.join(output_dir, CURRENT_NAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(generation)
+    os.replace(tmp_path, path)
+
+
+def remove_old_generations(output_dir: str, keep: int = KEEP_GENERATIONS):
+    root = os.path.join(output_dir, GENERATIONS_DIR)
+    current = current_generation(output_dir)
+    # Имена поколений - время создания, поэтому сортировка идёт от старых к новым
+    previous = [name for name in sorted(os.listdir(root)) if name != current]
+    for name in previous[:max(0, len(previous) - keep + 1)]:
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+def load_manifest(generation_path: Optional[str]) -> dict:
+    """Описание партиций поколения: {партиция: {category, fingerprint, products}}"""
+    if generation_path is None:
+        return {}
+    path = os.path.join(generation_path, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(generation_path: str, manifest: dict):
+    with open(os.path.join(generation_path, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+
+def document_digest(doc: dict) -> int:
+    """
+    Вклад документа в отпечаток категории: md5 от "id:хеш содержимого".
+    Ревизия CouchDB меняется и при повторной записи тех же данных, поэтому берётся,
+    только если хеша содержимого у старого документа ещё нет.
+    """
+    version = doc.get("content_hash") or doc["_rev"]
+    return int.from_bytes(hashlib.md5(f"{doc['_id']}:{version}".encode()).digest(), "big")
+
+
+def add_to_partition(partitions: dict[str, dict], doc: dict) -> str:
+    """Добавляет документ в отпечаток его категории; возвращает имя партиции"""
+    category = doc.get("Категория") or UNKNOWN_CATEGORY
+    part = partition_name(category)
+    partition = partitions.setdefault(part, {
+        "category": category, "fingerprint": 0, "products": 0, "version": EXPORT_VERSION
+    })
+    partition["fingerprint"] ^= document_digest(doc)
+    partition["products"] += 1
+    return part
+
+
+def format_fingerprints(partitions: dict[str, dict]):
+    for partition in partitions.values():
+        partition["fingerprint"] = f"{partition['fingerprint']:032x}"
+
+
+def scan_partitions() -> tuple[dict[str, dict], dict[str, list[str]]]:
+    """
+    Первый проход: по лёгким полям всех документов считает отпечаток каждой категории.
+    Отпечаток - XOR хешей документов, поэтому не зависит от порядка.
+    Вместе с описанием партиций возвращает id их документов: {партиция: [id]}.
+    """
+    db = get_or_create_database()
+    partitions: dict[str, dict] = {}
+    ids: dict[str, list[str]] = {}
+    for doc in iter_doc_fields(db, ["_id", "_rev", "content_hash", "Категория", "Ссылка"]):
+        if not doc.get("Ссылка"):
+            continue
+        ids.setdefault(add_to_partition(partitions, doc), []).append(doc["_id"])
+    format_fingerprints(partitions)
+    return partitions, ids
+
+
+def fetch_and_save_to_parquet(OUTPUT_DIR='./data'):
+    """
+    Основная функция: загрузка → очистка → сохранение.
+    Каждая выгрузка пишется в новое поколение, после чего указатель CURRENT атомарно
+    переключается на него, поэтому читатели никогда не видят недописанных файлов.
+    Перезаписываются только категории, в которых изменился состав документов, их содержимое или EXPORT_VERSION,
+    остальные переносятся из предыдущего поколения жёсткими ссылками.
+    Из CouchDB читаются только документы изменённых категорий по id из первого прохода;
+    они идут потоком прямо в row group'ы, память ограничена размером пачки, а не каталога.
+    Отпечаток перезаписанной категории пересчитывается по фактически записанным документам:
+    если документ успел измениться после первого прохода, манифест описывает то, что лежит в файлах.
+    """
+    print("Подключение к CouchDB...")
+    manifest, ids = scan_partitions()
+    if not manifest:
+        print("Нет данных в CouchDB.")
+        return
+
+    previous = current_generation(OUTPUT_DIR)
+    previous_dir = generation_dir(OUTPUT_DIR, previous) if previous else None
+    previous_manifest = load_manifest(previous_dir)
+    changed = {
+        part for part, partition in manifest.items()
+        if previous_manifest.get(part, {}).get("fingerprint") != partition["fingerprint"]
+        or previous_manifest.get(part, {}).get("version") != EXPORT_VERSION
+        or not partition_exists(previous_dir, part)
+    }
+    if not changed and previous_manifest.keys() == manifest.keys():
+        print(f"Изменений нет, текущее поколение {previous}")
+        return
+
+    generation = datetime.now().strftime(GENERATION_FORMAT)
+    target_dir = generation_dir(OUTPUT_DIR, generation)
+    for table_name in TABLES:
+        os.makedirs(os.path.join(target_dir, table_name), exist_ok=True)
+
+    try:
+        for part in manifest.keys() - changed:
+            link_partition(previous_dir, target_dir, part)
+
+        changed_ids = [doc_id for part in changed for doc_id in ids[part]]
+        del ids
+        print(f"Загрузка документов изменённых категорий: {len(changed)} ({len(changed_ids)} документов)...")
+        writers = {part: PartitionWriter(target_dir, part) for part in changed}
+        written: dict[str, dict] = {}
+        try:
+            for doc in iter_docs_by_ids(get_or_create_database(), changed_ids):
+                if not doc.get("Ссылка"):
+                    continue
+                # Документ, перенесённый в неизменённую категорию после первого прохода,
+                # попадёт в неё при следующей выгрузке: её отпечаток уже не совпадёт
+                writer = writers.get(partition_name(doc.get("Категория") or UNKNOWN_CATEGORY))
+                if writer is None:
+                    continue
+                add_to_partition(written, doc)
+                doc.pop('_id', None)
+                doc.pop('_rev', None)
+                writer.add(doc)
+        except Exception:
+            for writer in writers.values():
+                writer.abort()
+            raise
+        for writer in writers.values():
+            writer.close()
+
+        format_fingerprints(written)
+        for part in changed:
+            manifest[part].update(written.get(part, {"fingerprint": f"{0:032x}", "products": 0}))
+
+        save_manifest(target_dir, manifest)
+    except Exception:
+        shutil.rmtree(target_dir, ignore_errors=True)
+        raise
+
+    set_current_generation(OUTPUT_DIR, generation)
+    remove_old_generations(OUTPUT_DIR)
+    total = sum(item["products"] for item in manifest.values())
+    print(f"Сохранено {total} товаров в поколение {generation}, "
+          f"перезаписано категорий: {len(changed)} из {len(manifest)}")
+
+
+if __name__ == '__main__':
+    fetch_and_save_to_parquet()
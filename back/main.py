@@ -1,9 +1,9 @@
 import threading
 from api.api import api_run
-from parser.parser import run
+from parser.crawl_pool import run_pool
 
 
 if __name__ == "__main__":
-    thread = threading.Thread(target=run)
+    thread = threading.Thread(target=run_pool)
     thread.start()
     api_run()
\ No newline at end of file
@@ -0,0 +1,334 @@
+import asyncio
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future
+from time import monotonic, perf_counter
+from typing import Any, Callable, Optional
+
+import numpy as np
+
+
+MAX_BATCH_SIZE = 8          # Сколько запросов модель обрабатывает одним проходом
+BATCH_WAIT_MS = 10          # Сколько ждать попутных запросов после первого, мс
+MAX_PENDING = 64            # Запросов в очереди сверх этого не принимаем (queue.Full)
+LATENCY_WINDOW = 1000       # По скольким последним запросам считать перцентили задержки
+# Токенов потоковой генерации, после которых она уступает модель ждущей пачке. Меньше - пачки /ai/
+# ждут меньше, но поток под нагрузкой дольше тянет ответ и чаще переключается
+STREAM_CHUNK_TOKENS = 16
+
+
+class ModelTurn:
+    """
+    Очередь к модели в порядке прихода (по номерам-билетам) для пачек и потоковых генераций.
+    Поток, держащий модель, вызывает checkpoint после каждого токена и каждые chunk_tokens
+    токенов уступает её, если кто-то ждёт, а сам встаёт в конец очереди.
+    """
+
+    def __init__(self, chunk_tokens: int = STREAM_CHUNK_TOKENS):
+        self.chunk_tokens = max(1, chunk_tokens)
+        self.cond = threading.Condition()
+        self.next_ticket = 0
+        self.serving = 0
+        self.tokens = 0
+        self.yields = 0
+
+    def __enter__(self):
+        with self.cond:
+            ticket = self.next_ticket
+            self.next_ticket += 1
+            self.cond.wait_for(lambda: self.serving == ticket)
+            self.tokens = 0
+        return self
+
+    def __exit__(self, *exc):
+        with self.cond:
+            self.serving += 1
+            self.cond.notify_all()
+
+    def waiting(self) -> int:
+        """Сколько ждут модель, не считая держащего её"""
+        return self.next_ticket - self.serving - 1
+
+    def checkpoint(self):
+        with self.cond:
+            self.tokens += 1
+            if self.tokens < self.chunk_tokens or self.waiting() <= 0:
+                return
+            self.yields += 1
+        self.__exit__()
+        self.__enter__()
+
+
+class BatchingQueue:
+    """
+    Очередь запросов к модели с динамическим микробатчингом.
+    Фоновый поток берёт первый запрос, ещё BATCH_WAIT_MS собирает пришедшие следом
+    (но не больше MAX_BATCH_SIZE), прогоняет их одним вызовом generate_batch и отдаёт
+    каждому вызывающему его ответ через Future.
+    Потоковые генерации (call) идут в своих потоках, а модель делят с пачками через ModelTurn:
+    пачка ждёт не дольше STREAM_CHUNK_TOKENS токенов потока, поток до первого токена - не дольше
+    пачек, вставших в очередь раньше него. Под постоянной нагрузкой /ai/ поток получает модель
+    примерно через раз, поэтому его ответ растягивается, а пачки не стоят всю его генерацию.
+    С кэшем ответов (ResponseCache) запрос, найденный в LRU в памяти, отвечается сразу и в очередь
+    не попадает; поиск в SQLite делает поток пачек перед генерацией, а не вызывающий (цикл событий).
+    """
+
+    def __init__(self, generate_batch: Callable[[list], list], max_batch_size: int = MAX_BATCH_SIZE,
+                 wait_ms: float = BATCH_WAIT_MS, max_pending: int = MAX_PENDING, cache: Optional[Any] = None,
+                 stream_chunk_tokens: int = STREAM_CHUNK_TOKENS):
+        self.generate_batch = generate_batch
+        self.cache = cache
+        self.turn = ModelTurn(stream_chunk_tokens)
+        self.max_batch_size = max(1, max_batch_size)
+        self.wait = wait_ms / 1000
+        self.requests: queue.Queue = queue.Queue(maxsize=max_pending)
+        self.started = monotonic()
+        self.batches = 0
+        self.completed = 0
+        self.failed = 0
+        self.calls = 0
+        self.busy_time = 0.0
+        self.latencies: deque = deque(maxlen=LATENCY_WINDOW)
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, name="llm-batching", daemon=True)
+        self.thread.start()
+
+    def submit(self, prompt: str) -> Future:
+        """Ставит запрос в очередь; при переполненной очереди бросает queue.Full"""
+        if self.closed:
+            raise RuntimeError("Очередь модели остановлена")
+        future: Future = Future()
+        cached = self.cache.get_memory(prompt) if self.cache is not None else None
+        if cached is not None:
+            future.set_result(cached)
+            return future
+        self.requests.put_nowait((prompt, future, monotonic()))
+        return future
+
+    def call(self, func: Callable[[], Any]) -> Future:
+        """
+        Выполняет func (например, потоковую генерацию) в отдельном потоке, когда подойдёт его очередь к модели.
+        func должен вызывать checkpoint после каждого токена. Число одновременных вызовов ограничивает вызывающий
+        """
+        if self.closed:
+            raise RuntimeError("Очередь модели остановлена")
+        future: Future = Future()
+
+        def run():
+            # Отменён, пока поток запускался
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                with self.turn:
+                    if self.closed:
+                        raise RuntimeError("Очередь модели остановлена")
+                    result = func()
+                future.set_result(result)
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                self.calls += 1
+
+        threading.Thread(target=run, name="llm-stream", daemon=True).start()
+        return future
+
+    def checkpoint(self):
+        """Граница токена потоковой генерации: здесь она уступает модель ждущей пачке"""
+        self.turn.checkpoint()
+
+    def generate(self, prompt: str) -> str:
+        return self.submit(prompt).result()
+
+    async def generate_async(self, prompt: str) -> str:
+        return await asyncio.wrap_future(self.submit(prompt))
+
+    def _collect(self) -> list:
+        """Первый запрос ждём сколько угодно, остальные - не дольше окна ожидания"""
+        batch = [self.requests.get()]
+        deadline = monotonic() + self.wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return [item for item in batch if item is not None]
+
+    def _run(self):
+        while not self.closed:
+            batch = self._collect()
+            # Клиент мог уйти, пока запрос ждал в очереди
+            batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+            batch = self._lookup(batch)
+            if not batch:
+                continue
+
+            with self.turn:
+                started = perf_counter()
+                try:
+                    results = self.generate_batch([prompt for prompt, _, _ in batch])
+                except Exception as e:
+                    print(f"Ошибка генерации пачки из {len(batch)} запросов: {e}")
+                    self.failed += len(batch)
+                    for _, future, _ in batch:
+                        future.set_exception(e)
+                    continue
+                finally:
+                    self.busy_time += perf_counter() - started
+                    self.batches += 1
+
+            finished = monotonic()
+            for (_, future, enqueued), result in zip(batch, results):
+                future.set_result(result)
+                self.latencies.append(finished - enqueued)
+            self.completed += len(batch)
+            self._store(batch, results)
+        # Запросы, пришедшие, пока close() уже опустошал очередь
+        self._fail_pending()
+
+    def _lookup(self, batch: list) -> list:
+        """Отвечает из кэша на диске; возвращает запросы, которые нужно генерировать"""
+        if self.cache is None:
+            return batch
+        remaining = []
+        for item in batch:
+            try:
+                cached = self.cache.get(item[0])
+            except Exception as e:
+                print(f"Ошибка чтения кэша ответов: {e}")
+                cached = None
+            if cached is None:
+                remaining.append(item)
+            else:
+                item[1].set_result(cached)
+        return remaining
+
+    def _store(self, batch: list, results: list):
+        if self.cache is None:
+            return
+        try:
+            for (prompt, _, _), result in zip(batch, results):
+                if result:
+                    self.cache.put(prompt, result)
+        except Exception as e:
+            print(f"Ошибка записи в кэш ответов: {e}")
+
+    def stats(self) -> dict:
+        latencies = np.array(self.latencies) * 1000
+        processed = self.completed + self.failed
+        return {
+            "max_batch_size": self.max_batch_size,
+            "wait_ms": self.wait * 1000,
+            "pending": self.requests.qsize(),
+            "batches": self.batches,
+            "completed": self.completed,
+            "failed": self.failed,
+            "calls": self.calls,
+            "stream_yields": self.turn.yields,
+            "avg_batch_size": round(processed / self.batches, 2) if self.batches else 0.0,
+            # Пропускная способность модели, пока она занята, и в среднем с запуска
+            "busy_throughput_rps": round(self.completed / self.busy_time, 3) if self.busy_time else 0.0,
+            "throughput_rps": round(self.completed / (monotonic() - self.started), 3),
+            "latency_ms": {
+                "avg": round(float(latencies.mean()), 1) if len(latencies) else None,
+                "p50": round(float(np.percentile(latencies, 50)), 1) if len(latencies) else None,
+                "p95": round(float(np.percentile(latencies, 95)), 1) if len(latencies) else None,
+            },
+        }
+
+    def _fail_pending(self):
+        """Завершает ошибкой все запросы, оставшиеся в очереди, чтобы ожидающие не зависли"""
+        while True:
+            try:
+                item = self.requests.get_nowait()
+            except queue.Empty:
+                return
+            if item is not None and item[1].set_running_or_notify_cancel():
+                item[1].set_exception(RuntimeError("Очередь модели остановлена"))
+
+    def close(self):
+        """Останавливает поток после текущей пачки; запросы из очереди завершаются ошибкой"""
+        self.closed = True
+        self._fail_pending()
+        try:
+            self.requests.put_nowait(None)
+        except queue.Full:
+            pass
+
+
+def benchmark_batching(generate_batch: Callable[[list], list], prompts: list, sizes: tuple = (1, MAX_BATCH_SIZE)) -> dict:
+    """Все prompts отправляются разом; сравнение пропускной способности и задержки при разном размере пачки"""
+    results = {}
+    for size in sizes:
+        batcher = BatchingQueue(generate_batch, max_batch_size=size, max_pending=len(prompts) + 1)
+        started = perf_counter()
+        for future in [batcher.submit(prompt) for prompt in prompts]:
+            future.result()
+        elapsed = perf_counter() - started
+        stats = batcher.stats()
+        batcher.close()
+        results[size] = {
+            "throughput_rps": round(len(prompts) / elapsed, 3),
+            "avg_batch_size": stats["avg_batch_size"],
+            "latency_ms": stats["latency_ms"],
+        }
+    return results
+
+
+def benchmark_stream_under_load(generate_batch: Callable[[list], list], stream: Callable, prompts: list,
+                                chunks: tuple = (1, STREAM_CHUNK_TOKENS, 10 ** 9)) -> dict:
+    """
+    Время до первого токена и длительность потоковой генерации, пока очередь постоянно загружена
+    пачками prompts, и задержка этих пачек - при разном STREAM_CHUNK_TOKENS.
+    stream(run, checkpoint) -> итератор текста; 10 ** 9 - поток не уступает модель до конца.
+    """
+    results = {}
+    for chunk in chunks:
+        batcher = BatchingQueue(generate_batch, max_pending=len(prompts) + 1, stream_chunk_tokens=chunk)
+        loaded = threading.Event()
+        stopped = threading.Event()
+
+        def load():
+            while not stopped.is_set():
+                futures = [batcher.submit(prompt) for prompt in prompts]
+                loaded.set()
+                for future in futures:
+                    future.result()
+
+        thread = threading.Thread(target=load, daemon=True)
+        thread.start()
+        loaded.wait()
+        batcher.latencies.clear()
+        started = perf_counter()
+        first_token = None
+        for _ in stream(batcher.call, batcher.checkpoint):
+            if first_token is None:
+                first_token = perf_counter() - started
+        elapsed = perf_counter() - started
+        stopped.set()
+        # Пачки, ждавшие поток, досчитываются в задержку
+        thread.join()
+        latency = batcher.stats()["latency_ms"]
+        batcher.close()
+        results[chunk] = {
+            "time_to_first_token_ms": round(first_token * 1000, 1) if first_token is not None else None,
+            "stream_s": round(elapsed, 2),
+            "batch_latency_ms": latency,
+        }
+    return results
+
+
+if __name__ == '__main__':
+    from model.model import model
+    test_prompts = [f"Смартфон {i}: 6.1\", 8/128 ГБ, 4000 мА*ч, 50 Мп" for i in range(16)]
+    for batch_size, timings in benchmark_batching(model.generate_batch, test_prompts).items():
+        print(f"пачка до {batch_size}: {timings}")
+
+    def stream_answer(run, checkpoint):
+        return model.generate_stream(test_prompts[0], run=run, checkpoint=checkpoint)
+
+    for chunk, timings in benchmark_stream_under_load(model.generate_batch, stream_answer, test_prompts).items():
+        print(f"поток уступает каждые {chunk} токенов: {timings}")
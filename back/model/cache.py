@@ -0,0 +1,196 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from time import time
+from typing import Any, Optional
+
+
+RESPONSE_CACHE_PATH = "./data/llm_cache.sqlite3"
+CACHE_TTL = 7 * 24 * 3600       # Сколько живёт закэшированный ответ, сек
+MEMORY_ITEMS = 1024             # Ответов в LRU в памяти
+DISK_ITEMS = 100_000            # Ответов в SQLite; сверх этого удаляются давно не запрошенные
+TRIM_EVERY = 100                # Раз во сколько записей проверять размер и сроки на диске
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    adapter TEXT NOT NULL,
+    response TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at);
+"""
+
+
+def normalize_prompt(text: Optional[str]) -> str:
+    """Запросы, отличающиеся только регистром, пробелами или формой символов, считаются одинаковыми"""
+    if text is None:
+        return ""
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+
+def adapter_fingerprint(path: str) -> str:
+    """Хеш содержимого файлов LoRA-адаптера: меняется при любом переобучении"""
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            file_path = os.path.join(root, name)
+            digest.update(os.path.relpath(file_path, path).encode())
+            with open(file_path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+    return digest.hexdigest()
+
+
+def config_hash(generation_config: Any) -> str:
+    """Хеш параметров генерации (GenerationConfig или словарь)"""
+    params = generation_config.to_dict() if hasattr(generation_config, "to_dict") else dict(generation_config)
+    params.pop("transformers_version", None)
+    return hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class ResponseCache:
+    """
+    Кэш ответов модели: LRU в памяти поверх SQLite, который переживает перезапуск.
+    Генерация жадная (do_sample=False), поэтому одинаковый запрос даёт одинаковый ответ.
+    Ключ - нормализованный запрос, системное сообщение и хеш параметров генерации.
+    Записи другого адаптера удаляются при открытии, и адаптер тоже входит в ключ.
+    Безопасен для нескольких потоков: соединение с SQLite у каждого своё.
+    """
+
+    def __init__(self, adapter: str, config: str, system_message: Optional[str] = None,
+                 path: str = RESPONSE_CACHE_PATH, ttl: float = CACHE_TTL,
+                 memory_items: int = MEMORY_ITEMS, disk_items: int = DISK_ITEMS):
+        self.adapter = adapter
+        self.config = config
+        self.system_message = normalize_prompt(system_message)
+        self.path = path
+        self.ttl = ttl
+        self.memory_items = memory_items
+        self.disk_items = disk_items
+        # key → (ответ, время истечения)
+        self.memory: OrderedDict[str, tuple] = OrderedDict()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.expired = 0
+        self.evicted = 0
+        self.invalidated = 0
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        connection = self._connection()
+        connection.executescript(SCHEMA)
+        self.invalidated = connection.execute("DELETE FROM responses WHERE adapter != ?", (adapter,)).rowcount
+        if self.invalidated:
+            print(f"Адаптер модели изменился, удалено закэшированных ответов: {self.invalidated}")
+
+    def _connection(self) -> sqlite3.Connection:
+        """Отдельное соединение на каждый поток"""
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+        return connection
+
+    def key(self, prompt: str) -> str:
+        parts = [normalize_prompt(prompt), self.system_message, self.config, self.adapter]
+        return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode()).hexdigest()
+
+    def _remember(self, key: str, response: str, expires_at: float):
+        with self.lock:
+            self.memory[key] = (response, expires_at)
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.memory_items:
+                self.memory.popitem(last=False)
+
+    def _from_memory(self, key: str, now: float) -> Optional[str]:
+        with self.lock:
+            item = self.memory.get(key)
+            if item is not None:
+                if item[1] > now:
+                    self.memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return item[0]
+                del self.memory[key]
+        return None
+
+    def get_memory(self, prompt: str) -> Optional[str]:
+        """Только LRU в памяти, без SQLite: можно вызывать из цикла событий"""
+        return self._from_memory(self.key(prompt), time())
+
+    def get(self, prompt: str) -> Optional[str]:
+        """LRU в памяти, затем SQLite (блокирующий запрос - не из цикла событий)"""
+        key = self.key(prompt)
+        now = time()
+        cached = self._from_memory(key, now)
+        if cached is not None:
+            return cached
+
+        connection = self._connection()
+        row = connection.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is not None and row[1] + self.ttl <= now:
+            connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.expired += 1
+            row = None
+        if row is None:
+            self.misses += 1
+            return None
+
+        connection.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        self._remember(key, row[0], row[1] + self.ttl)
+        self.disk_hits += 1
+        return row[0]
+
+    def put(self, prompt: str, response: str):
+        key = self.key(prompt)
+        now = time()
+        self._remember(key, response, now + self.ttl)
+        self._connection().execute(
+            "INSERT OR REPLACE INTO responses (key, adapter, response, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+            (key, self.adapter, response, now, now)
+        )
+        self.stores += 1
+        if self.stores % TRIM_EVERY == 0:
+            self.trim()
+
+    def trim(self):
+        """Удаляет просроченные ответы и самые давно запрошенные сверх disk_items"""
+        connection = self._connection()
+        self.expired += connection.execute("DELETE FROM responses WHERE created_at <= ?",
+                                           (time() - self.ttl,)).rowcount
+        self.evicted += connection.execute(
+            "DELETE FROM responses WHERE key IN "
+            "(SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.disk_items,)
+        ).rowcount
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+        self._connection().execute("DELETE FROM responses")
+
+    def stats(self) -> dict:
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            "stores": self.stores,
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "invalidated": self.invalidated,
+            "memory_items": len(self.memory),
+        }
@@ -0,0 +1,40 @@
+BASE_MODEL_PATH = "./model/models/Qwen3-0.6B"
+LORA_ADAPTER_PATH = "./model/models/Qwen3-0.6B-finetuned"
+
+# Улучшенный системный промпт
+SYSTEM_MESSAGE = """
+                Ты - технический аналитик. Отвечай ТОЛЬКО в следующем формате:
+
+                Достоинства:
+                1. [конкретное достоинство №1]
+                2. [конкретное достоинство №2]
+                3. [конкретное достоинство №3]
+                
+                Недостатки:
+                1. [конкретный недостаток №1]
+                2. [конкретный недостаток №2]
+                3. [конкретный недостаток №3]
+                
+                ПРАВИЛА:
+                1. Каждый пункт должен быть конкретным техническим фактом
+                2. Не добавляй введение, заключение или комментарии
+                3. Не используй скобки (), кроме как для нумерации
+                4. Отвечай только на основе фактической информации
+                5. Если не знаешь, пиши "Недостаточно информации"
+                6. Строго ограничься 3 пунктами в каждом разделе
+                7. Не используй теги <think> или подобные
+            """
+
+# Параметры генерации; pad_token_id и eos_token_id добавляются из токенизатора
+GENERATION_PARAMS = dict(
+    max_new_tokens=300,
+    min_new_tokens=30,
+    do_sample=False,
+    temperature=0.3,
+    top_p=0.85,
+    top_k=30,
+    repetition_penalty=1.3,
+    no_repeat_ngram_size=4,
+    num_beams=1,
+    early_stopping=True
+)
@@ -1,11 +1,38 @@
-from transformers import AutoModelForCausalLM, AutoTokenizer, GenerationConfig
+from transformers import (AutoModelForCausalLM, AutoTokenizer, GenerationConfig, StoppingCriteria, StoppingCriteriaList,
+                          TextIteratorStreamer)
 import torch
 import re
+import threading
 from peft import PeftModel
+from model.cache import adapter_fingerprint, config_hash
+from model.config import BASE_MODEL_PATH, LORA_ADAPTER_PATH, SYSTEM_MESSAGE, GENERATION_PARAMS
+
+STREAM_TIMEOUT = 300    # Сколько ждать следующего токена при потоковой генерации (и своей очереди к модели), сек
+
+
+class StopOnEvent(StoppingCriteria):
+    """Останавливает генерацию, когда клиент потока отключился"""
+
+    def __init__(self, event: threading.Event):
+        self.event = event
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.full((input_ids.shape[0],), self.event.is_set(), dtype=torch.bool, device=input_ids.device)
+
+
+class Checkpoint(StoppingCriteria):
+    """Вызывает callback после каждого токена, ничего не останавливая (уступить модель очереди)"""
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def __call__(self, input_ids, scores, **kwargs):
+        self.callback()
+        return torch.zeros((input_ids.shape[0],), dtype=torch.bool, device=input_ids.device)
 
 
 class LLModel:
-    def __init__(self, base_model_path: str = "./model/models/Qwen3-0.6B", lora_adapter_path: str = "./model/models/Qwen3-0.6B-finetuned"):
+    def __init__(self, base_model_path: str = BASE_MODEL_PATH, lora_adapter_path: str = LORA_ADAPTER_PATH):
         # Загрузка токенизатора
         self.tokenizer = AutoTokenizer.from_pretrained(
             base_model_path,
@@ -47,20 +74,15 @@ class LLModel:
 
         # Предзагрузка конфигурации генерации
         self.generation_config = GenerationConfig(
-            max_new_tokens=300,
-            min_new_tokens=30,
-            do_sample=False,
-            temperature=0.3,
-            top_p=0.85,
-            top_k=30,
-            repetition_penalty=1.3,
-            no_repeat_ngram_size=4,
+            **GENERATION_PARAMS,
             pad_token_id=self.tokenizer.pad_token_id,
-            eos_token_id=self.tokenizer.eos_token_id,
-            num_beams=1,
-            early_stopping=True
+            eos_token_id=self.tokenizer.eos_token_id
         )
 
+        # По ним кэш ответов узнаёт, что сменились адаптер или параметры генерации
+        self.adapter_fingerprint = adapter_fingerprint(lora_adapter_path)
+        self.config_hash = config_hash(self.generation_config)
+
     def cleanup_response(self, text):
         """Очистка ответа от нежелательных частей"""
         text = re.sub(r'<think>.*?</think>', '', text, flags=re.DOTALL)
@@ -105,32 +127,10 @@ class LLModel:
 
         return '\n'.join(cleaned_lines).strip()
 
-    def generate(self, prompt, system_message=None):
-        """Генерация ответа с улучшенными параметрами"""
-        # Улучшенный системный промпт
+    def build_text(self, prompt, system_message=None):
+        """Текст запроса к модели по шаблону чата"""
         if system_message is None:
-            system_message = """
-                Ты - технический аналитик. Отвечай ТОЛЬКО в следующем формате:
-
-                Достоинства:
-                1. [конкретное достоинство №1]
-                2. [конкретное достоинство №2]
-                3. [конкретное достоинство №3]
-                
-                Недостатки:
-                1. [конкретный недостаток №1]
-                2. [конкретный недостаток №2]
-                3. [конкретный недостаток №3]
-                
-                ПРАВИЛА:
-                1. Каждый пункт должен быть конкретным техническим фактом
-                2. Не добавляй введение, заключение или комментарии
-                3. Не используй скобки (), кроме как для нумерации
-                4. Отвечай только на основе фактической информации
-                5. Если не знаешь, пиши "Недостаточно информации"
-                6. Строго ограничься 3 пунктами в каждом разделе
-                7. Не используй теги <think> или подобные
-            """
+            system_message = SYSTEM_MESSAGE
 
         # Формируем сообщения с учетом особенностей Qwen
         messages = [
@@ -149,9 +149,18 @@ class LLModel:
             # Fallback шаблон
             text = f"System: {system_message}\n\nUser: Проанализируй технические характеристики и перечисли достоинства и недостатки: {prompt}\n\nAssistant:"
 
+        return text
+
+    def generate_batch(self, prompts, system_message=None):
+        """
+        Генерация ответов на несколько запросов одним проходом модели.
+        Токенизатор дополняет запросы слева, поэтому сгенерированная часть у всех начинается с одной позиции.
+        """
+        texts = [self.build_text(prompt, system_message) for prompt in prompts]
+
         # Токенизация
         model_inputs = self.tokenizer(
-            text,
+            texts,
             return_tensors="pt",
             truncation=True,
             max_length=512,
@@ -168,23 +177,97 @@ class LLModel:
 
         # Декодируем только сгенерированную часть
         input_length = model_inputs.input_ids.shape[1]
-        output_ids = generated_ids[0][input_length:].tolist()
+        results = []
+        for row in generated_ids:
+            output_ids = row[input_length:].tolist()
 
-        # Останавливаемся на первом eos_token
-        if self.tokenizer.eos_token_id in output_ids:
-            eos_index = output_ids.index(self.tokenizer.eos_token_id)
-            output_ids = output_ids[:eos_index]
+            # Останавливаемся на первом eos_token: у закончивших раньше дальше идут только заполнители
+            if self.tokenizer.eos_token_id in output_ids:
+                eos_index = output_ids.index(self.tokenizer.eos_token_id)
+                output_ids = output_ids[:eos_index]
 
-        content = self.tokenizer.decode(
-            output_ids,
-            skip_special_tokens=True,
-            clean_up_tokenization_spaces=True
-        ).strip()
+            content = self.tokenizer.decode(
+                output_ids,
+                skip_special_tokens=True,
+                clean_up_tokenization_spaces=True
+            ).strip()
 
-        # Очистка ответа
-        content = self.cleanup_response(content)
+            # Очистка ответа
+            results.append(self.cleanup_response(content))
 
-        return content
+        return results
+
+    def generate(self, prompt, system_message=None):
+        """Генерация ответа с улучшенными параметрами"""
+        return self.generate_batch([prompt], system_message)[0]
+
+    def generate_stream(self, prompt, system_message=None, run=None, checkpoint=None):
+        """
+        Генерация с выдачей текста по мере появления токенов (без cleanup_response - см. model.streaming).
+        model.generate пишет в TextIteratorStreamer из другого потока: run(func) -> Future выполняет его
+        в очереди к модели (BatchingQueue.call), без run - в отдельном потоке.
+        checkpoint вызывается после каждого токена (BatchingQueue.checkpoint уступает модель пачкам).
+        Если генератор закрыть раньше, генерация останавливается на следующем токене
+        или не начинается, если ещё ждёт очереди.
+        """
+        model_inputs = self.tokenizer(
+            self.build_text(prompt, system_message),
+            return_tensors="pt",
+            truncation=True,
+            max_length=512
+        ).to(self.device)
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True,
+                                        timeout=STREAM_TIMEOUT)
+        stop = threading.Event()
+        errors = []
+        criteria = [StopOnEvent(stop)]
+        if checkpoint is not None:
+            # Первым: пока поток ждёт своей очереди, клиент может уйти - это увидит StopOnEvent
+            criteria.insert(0, Checkpoint(checkpoint))
+
+        def generate():
+            try:
+                with torch.no_grad():
+                    self.model.generate(
+                        input_ids=model_inputs.input_ids,
+                        attention_mask=model_inputs.attention_mask,
+                        generation_config=self.generation_config,
+                        streamer=streamer,
+                        stopping_criteria=StoppingCriteriaList(criteria)
+                    )
+            except Exception as e:
+                errors.append(e)
+                # Иначе читатель ждал бы токенов до таймаута
+                streamer.end()
+
+        if run is None:
+            thread = threading.Thread(target=generate, name="llm-stream", daemon=True)
+            thread.start()
+            done = thread.join
+        else:
+            future = run(generate)
+
+            def finished(future):
+                # Очередь остановили, и generate так и не запустился
+                if not future.cancelled() and future.exception() is not None:
+                    errors.append(future.exception())
+                    streamer.end()
+
+            def done():
+                # Ещё в очереди - отменяем, уже идёт - остановится на следующем токене
+                if not future.cancel():
+                    future.exception()
+
+            future.add_done_callback(finished)
+        try:
+            for text in streamer:
+                if text:
+                    yield text
+        finally:
+            stop.set()
+            done()
+        if errors:
+            raise errors[0]
 
 
 model = LLModel()
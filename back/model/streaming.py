@@ -0,0 +1,164 @@
+import re
+from typing import Optional
+
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+# Обрезают строку от себя до конца, как в LLModel.cleanup_response
+CUT_PATTERNS = [r'Вывод[аяю].*', r'В заключение.*', r'Таким образом.*']
+# Начала этих фраз придерживаются, пока не станет ясно, обрежут ли строку
+CUT_PREFIXES = ["Вывод", "В заключение", "Таким образом"]
+BANNED_WORDS = ['<', 'Вывод', 'Таким образом', 'В заключение']
+ITEMS_PER_SECTION = 3
+LIST_ITEM = re.compile(r'^\d+\.')
+
+
+def partial_suffix(text: str, token: str, limit: Optional[int] = None) -> int:
+    """Длина самого длинного конца text (не длиннее limit), с которого может начинаться token"""
+    limit = len(token) - 1 if limit is None else limit
+    for size in range(min(len(text), limit), 0, -1):
+        if token.startswith(text[-size:]):
+            return size
+    return 0
+
+
+def clean_line(line: str) -> str:
+    """Построчная часть cleanup_response: обрезка выводов и замена 1) на 1."""
+    for pattern in CUT_PATTERNS:
+        line = re.sub(pattern, '', line)
+    return re.sub(r'(\d+)\)', r'\1.', line)
+
+
+class StreamCleaner:
+    """
+    Потоковый вариант LLModel.cleanup_response для текста, приходящего по токенам.
+    feed(кусок) возвращает то, что уже можно показать: блоки <think> отбрасываются на лету,
+    пункты списков (не больше трёх на раздел) выдаются по мере генерации,
+    остальные строки - целиком, когда понятно, что их не нужно выбрасывать.
+    Решения по строкам те же, что у cleanup_response; если строка в конце всё же меняет вид
+    (например, пункт оказался заголовком), канонический текст - результат cleanup_response.
+    """
+
+    def __init__(self):
+        self.pending = ""           # Хвост, который может оказаться началом тега <think> или </think>
+        self.in_think = False
+        self.think_text = ""        # Содержимое незакрытого <think>: если он так и не закроется, текст вернётся
+        self.line = ""              # Текущая строка до очистки
+        self.line_emitted = ""      # Сколько очищенной текущей строки уже выдано
+        self.emitted_any = False
+        self.in_advantages = False
+        self.in_disadvantages = False
+        self.advantage_count = 0
+        self.disadvantage_count = 0
+
+    def _visible(self, chunk: str) -> str:
+        """Текст без блоков <think>...</think>"""
+        self.pending += chunk
+        visible = []
+        while True:
+            if self.in_think:
+                end = self.pending.find(THINK_CLOSE)
+                if end < 0:
+                    keep = partial_suffix(self.pending, THINK_CLOSE)
+                    self.think_text += self.pending[:len(self.pending) - keep]
+                    self.pending = self.pending[len(self.pending) - keep:]
+                    break
+                self.in_think = False
+                self.think_text = ""
+                self.pending = self.pending[end + len(THINK_CLOSE):]
+            else:
+                start = self.pending.find(THINK_OPEN)
+                if start < 0:
+                    keep = partial_suffix(self.pending, THINK_OPEN)
+                    visible.append(self.pending[:len(self.pending) - keep])
+                    self.pending = self.pending[len(self.pending) - keep:]
+                    break
+                visible.append(self.pending[:start])
+                self.in_think = True
+                self.pending = self.pending[start + len(THINK_OPEN):]
+        return "".join(visible)
+
+    def _classify(self, line: str) -> Optional[str]:
+        """Решение cleanup_response по готовой строке; меняет состояние разделов"""
+        if 'Достоинства:' in line or 'Преимущества:' in line:
+            self.in_advantages, self.in_disadvantages = True, False
+            self.advantage_count = 0
+            return 'Достоинства:'
+        if 'Недостатки:' in line:
+            self.in_disadvantages, self.in_advantages = True, False
+            self.disadvantage_count = 0
+            return '\nНедостатки:'
+        if self.in_advantages and LIST_ITEM.match(line):
+            self.advantage_count += 1
+            return line if self.advantage_count <= ITEMS_PER_SECTION else None
+        if self.in_disadvantages and LIST_ITEM.match(line):
+            self.disadvantage_count += 1
+            return line if self.disadvantage_count <= ITEMS_PER_SECTION else None
+        if line and not any(word in line for word in BANNED_WORDS):
+            return line
+        return None
+
+    def _open(self, text: str) -> str:
+        """Начало новой строки вывода: разделитель перед ней и strip() всего ответа в начале"""
+        if not self.emitted_any:
+            text = text.lstrip()
+            if not text:
+                return ""
+        separator = "\n" if self.emitted_any else ""
+        self.emitted_any = True
+        return separator + text
+
+    def _finish_line(self) -> str:
+        result = self._classify(clean_line(self.line).strip())
+        emitted, self.line, self.line_emitted = self.line_emitted, "", ""
+        if emitted:
+            # Начало строки уже выдано как пункт списка - дописываем остаток
+            return result[len(emitted):] if result is not None and result.startswith(emitted) else ""
+        return self._open(result) if result is not None else ""
+
+    def _list_item_in_progress(self, text: str) -> bool:
+        if not LIST_ITEM.match(text) or any(word in text for word in ('Достоинства:', 'Преимущества:', 'Недостатки:')):
+            return False
+        return ((self.in_advantages and self.advantage_count < ITEMS_PER_SECTION)
+                or (self.in_disadvantages and self.disadvantage_count < ITEMS_PER_SECTION))
+
+    def _partial_line(self) -> str:
+        """Уже не изменяемое начало текущей строки, если это пункт списка, который попадёт в ответ"""
+        text = clean_line(self.line).lstrip()
+        if not self._list_item_in_progress(text):
+            return ""
+        # Придерживаем хвост, который ещё может измениться: пробелы, цифры перед ')' и начало обрезающей фразы
+        while True:
+            held = text.rstrip().rstrip("0123456789")
+            # "Вывод" придерживается целиком: обрежет ли его, решает следующая буква
+            held = held[:len(held) - max(partial_suffix(held, prefix, len(prefix)) for prefix in CUT_PREFIXES)]
+            if held == text:
+                break
+            text = held
+        if len(text) <= len(self.line_emitted) or not text.startswith(self.line_emitted):
+            return ""
+        new, self.line_emitted = text[len(self.line_emitted):], text
+        return self._open(new) if len(self.line_emitted) == len(new) else new
+
+    def feed(self, chunk: str) -> str:
+        output = []
+        lines = self._visible(chunk).split("\n")
+        for part in lines[:-1]:
+            self.line += part
+            output.append(self._finish_line())
+        self.line += lines[-1]
+        output.append(self._partial_line())
+        return "".join(output)
+
+    def finish(self) -> str:
+        """Остаток после конца генерации; незакрытый <think> cleanup_response не удаляет"""
+        tail = THINK_OPEN + self.think_text + self.pending if self.in_think else self.pending
+        self.pending, self.in_think, self.think_text = "", False, ""
+        output = []
+        lines = tail.split("\n")
+        for part in lines[:-1]:
+            self.line += part
+            output.append(self._finish_line())
+        self.line += lines[-1]
+        output.append(self._finish_line())
+        return "".join(output)
@@ -0,0 +1,164 @@
+import hashlib
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from time import monotonic
+from typing import Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pandas import DataFrame
+
+from database.parquet_export import (PRODUCTS_SCHEMA, SPECS_SCHEMA, SUMMARIES_NAME, SUMMARIES_SCHEMA,
+                                     current_generation, generation_dir)
+from model.cache import adapter_fingerprint, config_hash
+from model.config import BASE_MODEL_PATH, LORA_ADAPTER_PATH, SYSTEM_MESSAGE, GENERATION_PARAMS
+
+
+SUMMARY_WORKERS = max(1, min(4, (os.cpu_count() or 1) // 4))   # Процессов с моделью; каждый держит свою копию
+SUMMARY_BATCH_SIZE = 16         # Товаров в одном проходе модели
+SPEC_LIMIT = 30                 # Сколько характеристик товара попадает в запрос
+CHECKPOINT_INTERVAL = 300       # Как часто сохранять готовые сводки, чтобы прерванный прогон не начинался заново, сек
+
+# Модель процесса-воркера, загружается один раз в initializer
+worker_model = None
+
+
+def model_version() -> str:
+    """Сводка устаревает при смене адаптера, параметров генерации или системного промпта"""
+    parts = [adapter_fingerprint(LORA_ADAPTER_PATH), config_hash(GENERATION_PARAMS), SYSTEM_MESSAGE]
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+
+def product_prompts(generation_path: str) -> DataFrame:
+    """Запрос к модели по каждому товару: название и первые SPEC_LIMIT характеристик"""
+    products = ds.dataset(os.path.join(generation_path, "products_main"), format="parquet", schema=PRODUCTS_SCHEMA)
+    products = products.to_table(columns=["id", "Наименование"]).to_pandas()
+    specs_path = os.path.join(generation_path, "specs")
+    if any(name.endswith(".parquet") for name in os.listdir(specs_path)):
+        specs = ds.dataset(specs_path, format="parquet", schema=SPECS_SCHEMA).to_table().to_pandas()
+    else:
+        specs = SPECS_SCHEMA.empty_table().to_pandas()
+
+    specs = specs[specs["value"].notna() & (specs["value"] != "")]
+    specs = specs.groupby("product_id").head(SPEC_LIMIT)
+    lines = (specs["key"] + ": " + specs["value"]).groupby(specs["product_id"]).agg("; ".join)
+
+    names = products["Наименование"].fillna("").str.strip()
+    details = products["id"].map(lines).fillna("")
+    prompts = (names + ". " + details).str.strip(" .")
+    return DataFrame({"id": products["id"], "prompt": prompts})[prompts != ""].drop_duplicates("id")
+
+
+def input_hash(prompt: str) -> str:
+    return hashlib.md5(prompt.encode()).hexdigest()
+
+
+def load_summaries(path: str) -> DataFrame:
+    if not os.path.exists(path):
+        return SUMMARIES_SCHEMA.empty_table().to_pandas()
+    return pq.read_table(path, schema=SUMMARIES_SCHEMA).to_pandas()
+
+
+def save_summaries(path: str, summaries: DataFrame):
+    """Запись через временный файл: API никогда не читает недописанный"""
+    table = pa.Table.from_pandas(summaries.sort_values("id"), schema=SUMMARIES_SCHEMA, preserve_index=False)
+    tmp_path = f"{path}.tmp"
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def sort_by_tokens(todo: DataFrame) -> DataFrame:
+    """Запросы похожей длины попадают в одну пачку, и на дополнение уходит меньше вычислений"""
+    from transformers import AutoTokenizer
+    tokenizer = AutoTokenizer.from_pretrained(BASE_MODEL_PATH, trust_remote_code=True)
+    lengths = [len(ids) for ids in tokenizer(todo["prompt"].tolist(), truncation=True, max_length=512)["input_ids"]]
+    return todo.assign(tokens=lengths).sort_values("tokens", kind="stable")
+
+
+def init_worker(threads: int):
+    import torch
+    torch.set_num_threads(threads)
+    global worker_model
+    from model.model import model
+    worker_model = model
+
+
+def summarize_batch(ids: list, prompts: list) -> list:
+    return list(zip(ids, worker_model.generate_batch(prompts)))
+
+
+def generate_summaries(OUTPUT_DIR: str = './data', workers: int = SUMMARY_WORKERS,
+                       batch_size: int = SUMMARY_BATCH_SIZE) -> Optional[DataFrame]:
+    """
+    Сводки достоинств и недостатков для товаров текущего поколения.
+    Генерируются только новые товары и те, у которых изменились входные данные или модель;
+    сводки исчезнувших товаров удаляются. Запросы сортируются по длине в токенах,
+    режутся на пачки и расходятся по пулу процессов, в каждом из которых своя модель.
+    """
+    generation = current_generation(OUTPUT_DIR)
+    if generation is None:
+        print("Нет выгруженных данных для сводок.")
+        return None
+
+    path = os.path.join(OUTPUT_DIR, SUMMARIES_NAME)
+    prompts = product_prompts(generation_dir(OUTPUT_DIR, generation))
+    prompts["input_hash"] = [input_hash(prompt) for prompt in prompts["prompt"]]
+    version = model_version()
+
+    existing = load_summaries(path)
+    current = existing.merge(prompts[["id", "input_hash"]], on=["id", "input_hash"])
+    current = current[current["model_version"] == version]
+    todo = prompts[~prompts["id"].isin(current["id"])]
+    print(f"Сводки: актуальных {len(current)}, к генерации {len(todo)}")
+    if todo.empty:
+        if len(current) != len(existing):
+            save_summaries(path, current)
+        return current
+
+    # Устаревшие сводки ещё живых товаров отдаются, пока не готовы новые
+    stale = existing[existing["id"].isin(todo["id"])]
+
+    def merged(done: list) -> DataFrame:
+        fresh = pd.concat([current, *done], ignore_index=True)
+        return pd.concat([fresh, stale[~stale["id"].isin(fresh["id"])]], ignore_index=True)
+
+    todo = sort_by_tokens(todo)
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    done = []
+    saved_at = monotonic()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=init_worker, initargs=(threads,)) as pool:
+        futures = {
+            pool.submit(summarize_batch, batch["id"].tolist(), batch["prompt"].tolist()): batch
+            for batch in (todo.iloc[start:start + batch_size] for start in range(0, len(todo), batch_size))
+        }
+        for future in as_completed(futures):
+            batch = futures[future]
+            try:
+                summaries = dict(future.result())
+            except Exception as e:
+                print(f"Ошибка генерации сводок для {len(batch)} товаров: {e}")
+                continue
+            done.append(DataFrame({
+                "id": batch["id"],
+                "summary": batch["id"].map(summaries),
+                "input_hash": batch["input_hash"],
+                "model_version": version,
+                "generated_at": datetime.now().isoformat(),
+            }))
+            if monotonic() - saved_at >= CHECKPOINT_INTERVAL:
+                save_summaries(path, merged(done))
+                saved_at = monotonic()
+
+    result = merged(done)
+    save_summaries(path, result)
+    print(f"Сводки сохранены: {len(result)}, сгенерировано за прогон: {sum(len(batch) for batch in done)}")
+    return result
+
+
+if __name__ == '__main__':
+    generate_summaries()
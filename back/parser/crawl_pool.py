@@ -0,0 +1,231 @@
+import os
+import threading
+from collections import OrderedDict
+
+from time import monotonic, sleep
+from typing import Optional
+
+from undetected_chromedriver import Chrome
+
+from database.mongodb_connector import start_mongodb, insert_data
+from database.couchdb_connector import mongo_to_couch
+from parser.parser import (CATEGORY_URLS, PAUSE_BETWEEN_RUNS, create_driver, get_max_pages,
+                           get_all_product_urls_in_category, parse_product)
+from parser.http_fetcher import CharacteristicsFetcher
+from parser.frontier import RENEW_INTERVAL, Frontier, lease_owner
+from parser.dedup import KnownUrls
+
+
+CRAWL_WORKERS = os.cpu_count() or 1       # Количество браузеров в пуле
+# Глобальный лимит одновременно загружаемых страниц - меньше числа браузеров:
+# пока одни загружают страницы, другие разбирают их и листают отзывы
+MAX_CONCURRENT_PAGES = max(1, CRAWL_WORKERS // 2)
+PREFETCH_LIMIT = 1000                     # Сколько предзагруженных характеристик держать до разбора товара
+SYNC_INTERVAL = 300                       # Период переноса данных из Mongo в Couch, сек
+IDLE_WAIT = 1                             # Пауза воркера, когда свободных задач пока нет, сек
+RESTART_PAUSE = 60                        # Пауза перед повторным запуском оборвавшегося прохода, сек
+
+# Типы задач в очереди
+CATEGORY = "category"
+LISTING = "listing"
+PRODUCT = "product"
+
+
+class CrawlPool:
+    """
+    Пул браузеров, разбирающих общий фронтир задач.
+    Задача категории порождает задачи страниц листинга,
+    задача страницы листинга - задачи товаров.
+    """
+
+    def __init__(self, frontier: Frontier, known: KnownUrls, workers: int = CRAWL_WORKERS,
+                 max_concurrency: int = MAX_CONCURRENT_PAGES,
+                 fetcher: Optional[CharacteristicsFetcher] = None):
+        self.frontier = frontier
+        self.known = known
+        self.workers = max(1, workers)
+        self.fetcher = fetcher
+        # Характеристики, заранее загруженные по HTTP: {char_url: данные}; общие для всех воркеров
+        self.prefetched: OrderedDict[str, dict] = OrderedDict()
+        self.prefetched_lock = threading.Lock()
+        # Ограничивает число одновременных загрузок страниц независимо от количества браузеров
+        self.page_slots = threading.BoundedSemaphore(max(1, max_concurrency))
+        # Задачи в работе для продления аренды: {владелец: ключ}
+        self.leases: dict[str, str] = {}
+        self.leases_lock = threading.Lock()
+        self.stopped = threading.Event()
+        # uc.Chrome патчит общий бинарник chromedriver, поэтому браузеры создаются по очереди
+        self.driver_lock = threading.Lock()
+
+    def _create_driver(self) -> Chrome:
+        with self.driver_lock:
+            return create_driver()
+
+    def _handle(self, driver: Chrome, kind: str, payload: tuple) -> bool:
+        """
+        Выполняет одну задачу и добавляет во фронтир порождённые ею задачи.
+        Возвращает False, если задачу стоит повторить.
+        """
+        if kind == CATEGORY:
+            link, = payload
+            with self.page_slots:
+                max_pages = get_max_pages(driver, link.format(page=1))
+            if max_pages is None:
+                return False
+            for page in range(1, max_pages + 1):
+                self.frontier.add(LISTING, link.format(page=page))
+
+        elif kind == LISTING:
+            url, = payload
+            with self.page_slots:
+                char_urls, opin_urls = get_all_product_urls_in_category(driver, url)
+            if not char_urls:
+                # Пустой листинг - обычно временная ошибка загрузки: задача повторится, а после
+                # max_attempts будет помечена неудавшейся
+                print(f'\nТоваров не найдено: {url}')
+                return False
+            # Вся страница кандидатов проверяется разом по загруженным заранее ссылкам
+            new_urls = set(self.known.filter_new([char_url.replace("/characteristics/", "/")
+                                                  for char_url in char_urls]))
+            new_products = [
+                (char_url, opin_url) for char_url, opin_url in zip(char_urls, opin_urls)
+                if char_url.replace("/characteristics/", "/") in new_urls
+            ]
+            if self.fetcher is not None and new_products:
+                # Характеристики всей страницы качаем параллельно по HTTP, браузер - только для защищённых
+                fetched = self.fetcher.fetch_many([char_url for char_url, _ in new_products])
+            else:
+                fetched = {}
+            for char_url, opin_url in new_products:
+                # Уже стоящий во фронтире товар (дубль) предзагрузка не нужна - иначе её никто не заберёт
+                if self.frontier.add(PRODUCT, char_url, opin_url) and fetched.get(char_url) is not None:
+                    self._remember_prefetched(char_url, fetched[char_url])
+
+        elif kind == PRODUCT:
+            char_url, opin_url = payload
+            # Забирается при первой попытке: при повторах характеристики качаются заново
+            with self.prefetched_lock:
+                char_data = self.prefetched.pop(char_url, None)
+            if char_data is None and self.fetcher is not None:
+                # Например, после перезапуска, когда предзагруженное потеряно
+                char_data = self.fetcher.fetch(char_url)
+            with self.page_slots:
+                result = parse_product(driver, char_url, opin_url, char_data)
+            if result is None:
+                return False
+            insert_data(result)
+            self.known.add(result["Ссылка"])
+
+        return True
+
+    def _remember_prefetched(self, char_url: str, data: dict):
+        """Самые старые записи вытесняются: их товары, скорее всего, уже не будут разобраны в этом проходе"""
+        with self.prefetched_lock:
+            self.prefetched[char_url] = data
+            while len(self.prefetched) > PREFETCH_LIMIT:
+                self.prefetched.popitem(last=False)
+
+    def _worker(self):
+        """Цикл одного браузера: арендует задачи, пока во фронтире есть незавершённые"""
+        owner = lease_owner(threading.current_thread().name)
+        driver: Optional[Chrome] = None
+        try:
+            driver = self._create_driver()
+            while True:
+                task = self.frontier.lease(owner)
+                if task is None:
+                    if not self.frontier.has_unfinished():
+                        break
+                    # Задачи ещё выполняются другими воркерами и могут породить новые
+                    sleep(IDLE_WAIT)
+                    continue
+                key, kind, payload = task
+                with self.leases_lock:
+                    self.leases[owner] = key
+                try:
+                    if self._handle(driver, kind, payload):
+                        finished = self.frontier.complete(key, owner)
+                    else:
+                        finished = self.frontier.fail(key, owner, "Пустой или невалидный результат")
+                except Exception as error:
+                    print(f"Ошибка обработки задачи {key}: {error}")
+                    finished = self.frontier.fail(key, owner, str(error))
+                finally:
+                    with self.leases_lock:
+                        self.leases.pop(owner, None)
+                if not finished:
+                    print(f"Аренда задачи {key} истекла, её выполняет другой воркер")
+        except Exception as error:
+            print(f"Ошибка запуска браузера: {error}")
+        finally:
+            if driver is not None:
+                driver.quit()
+
+    def _renew_leases(self):
+        """Продлевает аренду задач, которые ещё выполняются (например, долгая прокрутка отзывов)"""
+        while not self.stopped.wait(RENEW_INTERVAL):
+            with self.leases_lock:
+                leases = list(self.leases.items())
+            for owner, key in leases:
+                try:
+                    if not self.frontier.renew(key, owner):
+                        print(f"Не удалось продлить аренду задачи {key}")
+                except Exception as error:
+                    print(f"Ошибка продления аренды {key}: {error}")
+
+    def run(self):
+        """Разбирает фронтир до конца, периодически перенося собранное в CouchDB"""
+        threads = [
+            threading.Thread(target=self._worker, name=f"crawler-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in threads:
+            thread.start()
+        self.stopped.clear()
+        threading.Thread(target=self._renew_leases, name="lease-renewal", daemon=True).start()
+
+        deadline = monotonic() + SYNC_INTERVAL
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(max(0.0, deadline - monotonic()))
+                if monotonic() >= deadline:
+                    mongo_to_couch()
+                    deadline = monotonic() + SYNC_INTERVAL
+        self.stopped.set()
+        mongo_to_couch()
+
+
+def run_pool(workers: int = CRAWL_WORKERS, max_concurrency: int = MAX_CONCURRENT_PAGES):
+    """
+    Запуск парсера в режиме пула браузеров.
+    Незавершённый проход продолжается с места остановки, новый начинается
+    не раньше чем через PAUSE_BETWEEN_RUNS после окончания предыдущего.
+    """
+    frontier = Frontier()
+    # Задачи упавшего прошлого запуска на этом хосте не ждут истечения аренды
+    frontier.release_dead_leases()
+    while True:
+        if frontier.has_unfinished():
+            print(f"Продолжаем обход: {frontier.counts()}")
+        else:
+            sleep(frontier.pause_remaining(PAUSE_BETWEEN_RUNS))
+            frontier.start_pass(CATEGORY_URLS)
+
+        start_mongodb()
+        known = KnownUrls().preload()
+        fetcher = CharacteristicsFetcher()
+        try:
+            CrawlPool(frontier, known, workers, max_concurrency, fetcher).run()
+        finally:
+            fetcher.close()
+
+        if frontier.has_unfinished():
+            # Воркеры остановились раньше времени (например, не запустился браузер)
+            sleep(RESTART_PAUSE)
+        else:
+            print(f"Проход завершён: {frontier.counts()}")
+            frontier.finish_pass()
+
+
+if __name__ == '__main__':
+    run_pool()
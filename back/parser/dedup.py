@@ -0,0 +1,79 @@
+import math
+import hashlib
+import threading
+
+from database.mongodb_connector import ensure_url_index, count_data, load_known_urls, find_existing_urls
+
+
+BLOOM_THRESHOLD = 2_000_000     # С какого размера каталога вместо множества используется фильтр Блума
+BLOOM_ERROR_RATE = 0.001        # Допустимая доля ложных срабатываний фильтра
+
+
+class BloomFilter:
+    """Фильтр Блума на bytearray с двойным хешированием"""
+
+    def __init__(self, capacity: int, error_rate: float = BLOOM_ERROR_RATE):
+        capacity = max(1, capacity)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class KnownUrls:
+    """
+    Ссылки товаров, которые уже есть в MongoDB, загруженные один раз на весь обход.
+    Небольшой каталог держится в множестве и проверяется без запросов к бд.
+    Для большого каталога используется фильтр Блума: его «нет» точное,
+    а кандидатов с «возможно есть» со всей страницы листинга проверяет один запрос $in.
+    """
+
+    def __init__(self, bloom_threshold: int = BLOOM_THRESHOLD):
+        self.bloom_threshold = bloom_threshold
+        self.urls: set[str] = set()
+        self.bloom = None
+        self.lock = threading.Lock()
+
+    def preload(self) -> "KnownUrls":
+        ensure_url_index()
+        expected = count_data()
+        if expected >= self.bloom_threshold:
+            # Запас по ёмкости на товары, добавленные за время обхода
+            self.bloom = BloomFilter(expected * 2)
+        for url in load_known_urls():
+            self._add(url)
+        print(f"Загружено известных ссылок: {expected}")
+        return self
+
+    def _add(self, url: str):
+        if self.bloom is not None:
+            self.bloom.add(url)
+        else:
+            self.urls.add(url)
+
+    def add(self, url: str):
+        """Запоминает ссылку только что сохранённого товара"""
+        with self.lock:
+            self._add(url.strip())
+
+    def filter_new(self, urls: list[str]) -> list[str]:
+        """Возвращает ссылки, которых ещё нет в бд, сохраняя порядок"""
+        urls = [url.strip() for url in urls]
+        if self.bloom is None:
+            return [url for url in urls if url not in self.urls]
+
+        maybe_known = [url for url in urls if url in self.bloom]
+        existing = find_existing_urls(maybe_known)
+        return [url for url in urls if url not in existing]
@@ -0,0 +1,374 @@
+import os
+import re
+import sys
+import threading
+
+from time import perf_counter
+from typing import Callable, Optional, Tuple
+
+import lxml.html
+from lxml import etree
+from bs4 import BeautifulSoup
+
+from parser.pacing import OPINION_SELECTOR
+
+
+EXTRACTION_ENGINE = "lxml"              # Движок по умолчанию: "lxml" или "bs4"
+FIXTURES_DIR = "./parser/fixtures"      # Страницы *.characteristics.html и *.opinion.html для compare_engines
+
+
+def parse_price(text: str) -> int:
+    """Оставляет в строке с ценой только цифры"""
+    cleaned = re.sub(r'[^\d\s]', '', text).replace('\xa0', ' ')
+    return int(cleaned.replace(' ', ''))
+
+
+# ---------- BeautifulSoup: эталонная реализация ----------
+
+def bs4_characteristics(html: str, url: str) -> dict:
+    """Извлекает характеристики товара из HTML страницы /characteristics/ через BeautifulSoup"""
+    soup = BeautifulSoup(html, 'lxml')
+    name = soup.find('h1', class_="title")
+
+    price_div = soup.find('div', class_='product-buy__price')
+    price_number = 0
+
+    # Удаляем вложенный span
+    if price_div:
+        prev_span = price_div.find('span', class_='product-buy__prev')
+        if prev_span:
+            prev_span.decompose()  # Удаляет тег из дерева
+
+        # Получаем текущую цену
+        price_number = parse_price(price_div.get_text(strip=True))
+
+    rate = soup.find('a', class_="header-product__link_rating")
+    desc = soup.find('div', class_="product-card-description-text")
+
+    category = "Не указана"
+    for span in soup.find_all('span'):
+        if span.get('data-go-back-catalog') is not None:
+            category = span.get_text(strip=True).lstrip(': ')
+            break
+
+    charcs = soup.find_all('div', class_="product-characteristics__spec-title")
+    cvalue = soup.find_all('div', class_="product-characteristics__spec-value")
+    tech_spec = {
+        title.get_text(strip=True): value.get_text(strip=True)
+        for title, value in zip(charcs, cvalue)
+    }
+
+    # Очищаем название от слова "Характеристики"
+    raw_name = name.get_text(strip=True) if name else "Не указано"
+    clean_name = raw_name.replace("Характеристики", "").strip()
+
+    return {
+        "Категория": category,
+        "Наименование": clean_name,
+        "Цена": price_number,
+        "Рейтинг": rate.get_text(strip=True) if rate else "Нет рейтинга",
+        "Ссылка": url.replace("/characteristics/", "/"),
+        "Описание": desc.get_text(strip=True) if desc else "Описание отсутствует",
+        "Характеристики": tech_spec,
+    }
+
+
+def bs4_opinion_block(block) -> dict:
+    """Разбирает один блок отзыва div.ow-opinion"""
+    # Автор
+    author_elem = block.select_one(".profile-info__name")
+    author = author_elem.get_text(strip=True) if author_elem else "Аноним"
+
+    # Дата
+    date_elem = block.select_one(".ow-opinion__date")
+    date = date_elem.get_text(strip=True) if date_elem else ""
+
+    # Реальный покупатель
+    is_real = bool(block.select_one("[data-real-buyer]"))
+
+    # Общий рейтинг (звезды)
+    stars = len(block.select(".star-rating__star[data-state='selected']"))
+
+    # Оценки по категориям
+    category_ratings = {}
+    rating_items = block.select(".opinion-rating-slider__tab")
+    for item in rating_items[1:]:
+        num_elem = item.select_one("span:first-child")
+        name_elem = item.select_one(".opinion-rating-slider__tab-title_name")
+        if num_elem and name_elem:
+            name = name_elem.get_text(strip=True).rstrip(":")
+            try:
+                value = int(num_elem.get_text(strip=True))
+                category_ratings[name] = value
+            except (ValueError, AttributeError):
+                continue
+
+    # Срок использования
+    usage_period = ""
+    usage_elem = block.select_one(".ow-opinion__info-desc")
+    if usage_elem:
+        usage_period = usage_elem.get_text(strip=True)
+
+    # Достоинства / Недостатки / Комментарий
+    texts = {}
+    for text_block in block.select(".ow-opinion__text"):
+        title_elem = text_block.select_one(".ow-opinion__text-title")
+        desc_elem = text_block.select_one(".ow-opinion__text-desc")
+        if title_elem and desc_elem:
+            title = title_elem.get_text(strip=True)
+            desc = desc_elem.get_text(strip=True)
+            texts[title] = desc
+
+    return {
+        "Автор": author,
+        "Дата": date,
+        "Реальный покупатель": is_real,
+        "Общий рейтинг": stars,
+        "Оценки по категориям": category_ratings,
+        "Срок использования": usage_period,
+        "Достоинства": texts.get("Достоинства", ""),
+        "Недостатки": texts.get("Недостатки", ""),
+        "Комментарий": texts.get("Комментарий", ""),
+    }
+
+
+def bs4_opinions(html: str) -> Tuple[list[dict], int]:
+    """
+    Разбирает блоки отзывов из HTML.
+    Возвращает список отзывов и количество найденных блоков (включая неразобранные).
+    """
+    reviews = []
+    opinion_blocks = BeautifulSoup(html, 'lxml').select(OPINION_SELECTOR)
+    for block in opinion_blocks:
+        try:
+            reviews.append(bs4_opinion_block(block))
+        except Exception as error:
+            print(f"Ошибка при парсинге одного отзыва: {error}")
+    return reviews, len(opinion_blocks)
+
+
+# ---------- lxml: предкомпилированные XPath без построения дерева BeautifulSoup ----------
+
+def _has_class(name: str) -> str:
+    """XPath-условие, эквивалентное CSS-селектору .name"""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+XP_NAME = etree.XPath(f"(//h1[{_has_class('title')}])[1]")
+XP_PRICE = etree.XPath(f"(//div[{_has_class('product-buy__price')}])[1]")
+XP_PREV_PRICE = etree.XPath(f"(.//span[{_has_class('product-buy__prev')}])[1]")
+XP_RATE = etree.XPath(f"(//a[{_has_class('header-product__link_rating')}])[1]")
+XP_DESC = etree.XPath(f"(//div[{_has_class('product-card-description-text')}])[1]")
+XP_CATEGORY = etree.XPath("(//span[@data-go-back-catalog])[1]")
+XP_SPEC_TITLES = etree.XPath(f"//div[{_has_class('product-characteristics__spec-title')}]")
+XP_SPEC_VALUES = etree.XPath(f"//div[{_has_class('product-characteristics__spec-value')}]")
+
+XP_OPINIONS = etree.XPath(f"//div[{_has_class('ow-opinion')} and @data-role='opinion']")
+XP_AUTHOR = etree.XPath(f"(.//*[{_has_class('profile-info__name')}])[1]")
+XP_DATE = etree.XPath(f"(.//*[{_has_class('ow-opinion__date')}])[1]")
+XP_REAL_BUYER = etree.XPath("boolean(.//*[@data-real-buyer])")
+XP_STARS = etree.XPath(f"count(.//*[{_has_class('star-rating__star')} and @data-state='selected'])")
+XP_RATING_TABS = etree.XPath(f".//*[{_has_class('opinion-rating-slider__tab')}]")
+XP_FIRST_CHILD_SPAN = etree.XPath("(.//span[not(preceding-sibling::*)])[1]")
+XP_RATING_NAME = etree.XPath(f"(.//*[{_has_class('opinion-rating-slider__tab-title_name')}])[1]")
+XP_USAGE = etree.XPath(f"(.//*[{_has_class('ow-opinion__info-desc')}])[1]")
+XP_TEXT_BLOCKS = etree.XPath(f".//*[{_has_class('ow-opinion__text')}]")
+XP_TEXT_TITLE = etree.XPath(f"(.//*[{_has_class('ow-opinion__text-title')}])[1]")
+XP_TEXT_DESC = etree.XPath(f"(.//*[{_has_class('ow-opinion__text-desc')}])[1]")
+
+# Строки внутри этих тегов BeautifulSoup не включает в get_text()
+SKIPPED_TEXT_TAGS = {"script", "style", "template"}
+
+# Парсеры lxml нельзя делить между потоками
+_local = threading.local()
+
+
+def _parse_document(html: str):
+    parser = getattr(_local, "parser", None)
+    if parser is None:
+        parser = _local.parser = lxml.html.HTMLParser(encoding="utf-8")
+    try:
+        return lxml.html.document_fromstring(html.encode("utf-8"), parser=parser)
+    except etree.ParserError:
+        # Пустой документ: BeautifulSoup в этом случае просто ничего не находит
+        return lxml.html.document_fromstring(b"<html></html>", parser=parser)
+
+
+def _first(xpath: etree.XPath, node):
+    found = xpath(node)
+    return found[0] if found else None
+
+
+def _text(element, skip=None) -> str:
+    """
+    Аналог get_text(strip=True): склеивает очищенные от пробелов текстовые узлы.
+    Поддерево skip пропускается (как после decompose()), но текст за ним остаётся.
+    """
+    parts = []
+    stack = [(element, False)]
+    while stack:
+        node, is_tail = stack.pop()
+        if is_tail:
+            if node.tail:
+                piece = node.tail.strip()
+                if piece:
+                    parts.append(piece)
+            continue
+        if node is not element:
+            # Хвост идёт после всего поддерева узла
+            stack.append((node, True))
+        if node is skip or not isinstance(node.tag, str) or node.tag in SKIPPED_TEXT_TAGS:
+            continue
+        if node.text:
+            piece = node.text.strip()
+            if piece:
+                parts.append(piece)
+        stack.extend((child, False) for child in reversed(node))
+    return "".join(parts)
+
+
+def lxml_characteristics(html: str, url: str) -> dict:
+    """Извлекает характеристики товара из HTML страницы /characteristics/ через lxml"""
+    root = _parse_document(html)
+    name = _first(XP_NAME, root)
+
+    price_div = _first(XP_PRICE, root)
+    price_number = 0
+    if price_div is not None:
+        # Старая цена не учитывается, как и в эталонной реализации
+        price_number = parse_price(_text(price_div, skip=_first(XP_PREV_PRICE, price_div)))
+
+    rate = _first(XP_RATE, root)
+    desc = _first(XP_DESC, root)
+
+    category_span = _first(XP_CATEGORY, root)
+    category = _text(category_span).lstrip(': ') if category_span is not None else "Не указана"
+
+    tech_spec = {
+        _text(title): _text(value)
+        for title, value in zip(XP_SPEC_TITLES(root), XP_SPEC_VALUES(root))
+    }
+
+    raw_name = _text(name) if name is not None else "Не указано"
+    clean_name = raw_name.replace("Характеристики", "").strip()
+
+    return {
+        "Категория": category,
+        "Наименование": clean_name,
+        "Цена": price_number,
+        "Рейтинг": _text(rate) if rate is not None else "Нет рейтинга",
+        "Ссылка": url.replace("/characteristics/", "/"),
+        "Описание": _text(desc) if desc is not None else "Описание отсутствует",
+        "Характеристики": tech_spec,
+    }
+
+
+def lxml_opinion_block(block) -> dict:
+    """Разбирает один блок отзыва div.ow-opinion"""
+    author_elem = _first(XP_AUTHOR, block)
+    date_elem = _first(XP_DATE, block)
+
+    category_ratings = {}
+    for item in XP_RATING_TABS(block)[1:]:
+        num_elem = _first(XP_FIRST_CHILD_SPAN, item)
+        name_elem = _first(XP_RATING_NAME, item)
+        if num_elem is not None and name_elem is not None:
+            try:
+                category_ratings[_text(name_elem).rstrip(":")] = int(_text(num_elem))
+            except ValueError:
+                continue
+
+    usage_elem = _first(XP_USAGE, block)
+
+    texts = {}
+    for text_block in XP_TEXT_BLOCKS(block):
+        title_elem = _first(XP_TEXT_TITLE, text_block)
+        desc_elem = _first(XP_TEXT_DESC, text_block)
+        if title_elem is not None and desc_elem is not None:
+            texts[_text(title_elem)] = _text(desc_elem)
+
+    return {
+        "Автор": _text(author_elem) if author_elem is not None else "Аноним",
+        "Дата": _text(date_elem) if date_elem is not None else "",
+        "Реальный покупатель": bool(XP_REAL_BUYER(block)),
+        "Общий рейтинг": int(XP_STARS(block)),
+        "Оценки по категориям": category_ratings,
+        "Срок использования": _text(usage_elem) if usage_elem is not None else "",
+        "Достоинства": texts.get("Достоинства", ""),
+        "Недостатки": texts.get("Недостатки", ""),
+        "Комментарий": texts.get("Комментарий", ""),
+    }
+
+
+def lxml_opinions(html: str) -> Tuple[list[dict], int]:
+    """То же, что bs4_opinions, но через lxml"""
+    reviews = []
+    opinion_blocks = XP_OPINIONS(_parse_document(html))
+    for block in opinion_blocks:
+        try:
+            reviews.append(lxml_opinion_block(block))
+        except Exception as error:
+            print(f"Ошибка при парсинге одного отзыва: {error}")
+    return reviews, len(opinion_blocks)
+
+
+# ---------- Выбор движка ----------
+
+ENGINES: dict[str, Tuple[Callable[[str, str], dict], Callable[[str], Tuple[list[dict], int]]]] = {
+    "bs4": (bs4_characteristics, bs4_opinions),
+    "lxml": (lxml_characteristics, lxml_opinions),
+}
+
+
+def extract_characteristics(html: str, url: str, engine: Optional[str] = None) -> dict:
+    """Извлекает характеристики товара выбранным движком"""
+    return ENGINES[engine or EXTRACTION_ENGINE][0](html, url)
+
+
+def extract_opinions(html: str, engine: Optional[str] = None) -> Tuple[list[dict], int]:
+    """Извлекает отзывы выбранным движком, возвращает отзывы и количество блоков"""
+    return ENGINES[engine or EXTRACTION_ENGINE][1](html)
+
+
+def compare_engines(fixtures_dir: str = FIXTURES_DIR, repeat: int = 5) -> dict:
+    """
+    Проверяет, что все движки дают одинаковые словари на сохранённых страницах,
+    и замеряет их скорость. Возвращает {движок: страниц в секунду}.
+    """
+    pages = []
+    for file_name in sorted(os.listdir(fixtures_dir)):
+        with open(os.path.join(fixtures_dir, file_name), encoding="utf-8") as f:
+            html = f.read()
+        if file_name.endswith(".characteristics.html"):
+            url = f"https://www.dns-shop.ru/product/{file_name.split('.')[0]}/characteristics/"
+            pages.append((file_name, lambda h, e, u=url: extract_characteristics(h, u, e), html))
+        elif file_name.endswith(".opinion.html"):
+            pages.append((file_name, lambda h, e: extract_opinions(h, e), html))
+
+    if not pages:
+        print(f"Нет сохранённых страниц в {fixtures_dir}")
+        return {}
+
+    mismatches = 0
+    for file_name, extract, html in pages:
+        reference = extract(html, "bs4")
+        for engine in ENGINES:
+            if extract(html, engine) != reference:
+                mismatches += 1
+                print(f"Расхождение движка {engine} на {file_name}")
+    print(f"Проверено страниц: {len(pages)}, расхождений: {mismatches}")
+
+    throughput = {}
+    for engine in ENGINES:
+        started = perf_counter()
+        for _ in range(repeat):
+            for _, extract, html in pages:
+                extract(html, engine)
+        elapsed = perf_counter() - started
+        throughput[engine] = len(pages) * repeat / elapsed
+        print(f"{engine}: {throughput[engine]:.1f} страниц/с")
+    return throughput
+
+
+if __name__ == '__main__':
+    compare_engines(sys.argv[1] if len(sys.argv) > 1 else FIXTURES_DIR)
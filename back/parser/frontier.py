@@ -0,0 +1,236 @@
+import os
+import json
+import socket
+import sqlite3
+import threading
+
+from time import time
+from typing import Optional, Tuple
+
+
+FRONTIER_PATH = "./data/frontier.sqlite3"
+LEASE_TIMEOUT = 900         # Через сколько секунд без продления аренды задача снова считается свободной
+RENEW_INTERVAL = LEASE_TIMEOUT / 3  # Как часто воркер продлевает аренду задачи, которую ещё выполняет
+MAX_ATTEMPTS = 3            # После стольких неудачных попыток задача помечается failed
+
+# Состояния задач
+PENDING = "pending"
+IN_PROGRESS = "in_progress"
+DONE = "done"
+FAILED = "failed"
+
+# Сначала добиваем товары, затем страницы листинга и только потом новые категории,
+# чтобы фронтир не разрастался
+KIND_PRIORITY = {"product": 0, "listing": 1, "category": 2}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    key TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    leased_until REAL,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS items_state ON items (state, priority, created_at);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def lease_owner(thread_name: str) -> str:
+    """Владелец аренды "<хост>/<pid>/<поток>": "/" не встречается в именах хостов"""
+    return f"{socket.gethostname()}/{os.getpid()}/{thread_name}"
+
+
+def parse_owner(owner: Optional[str]) -> Optional[Tuple[str, int, str]]:
+    """(хост, pid, поток) или None для владельца в другом формате"""
+    parts = (owner or "").split("/", 2)
+    if len(parts) != 3 or not parts[1].isdigit():
+        return None
+    return parts[0], int(parts[1]), parts[2]
+
+
+def process_alive(pid: int) -> bool:
+    """Жив ли процесс с таким pid на этом хосте"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+class Frontier:
+    """
+    Сохраняемая в SQLite очередь обхода: категории, страницы листинга и товары
+    с состоянием, числом попыток и временем изменения.
+    Задачи выдаются в аренду: воркер продлевает её (renew), пока выполняет задачу; если он упал,
+    по истечении аренды задачу заберёт другой, а завершить её может только текущий владелец.
+    Безопасна для нескольких потоков и процессов (запись идёт в транзакциях BEGIN IMMEDIATE).
+    """
+
+    def __init__(self, path: str = FRONTIER_PATH, lease_timeout: float = LEASE_TIMEOUT,
+                 max_attempts: int = MAX_ATTEMPTS):
+        self.path = path
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        self.local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        """Отдельное соединение на каждый поток"""
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+        return connection
+
+    def _write(self, query: str, params: tuple = ()) -> int:
+        return self._connection().execute(query, params).rowcount
+
+    def add(self, kind: str, *payload: str) -> bool:
+        """Добавляет задачу, если её ещё нет. Ключ - первая ссылка в payload"""
+        now = time()
+        return self._write(
+            "INSERT OR IGNORE INTO items (key, kind, payload, priority, state, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (payload[0], kind, json.dumps(payload), KIND_PRIORITY.get(kind, 0), PENDING, now, now)
+        ) > 0
+
+    def lease(self, owner: str) -> Optional[Tuple[str, str, tuple]]:
+        """Забирает следующую свободную задачу. Возвращает (ключ, тип, payload) или None"""
+        connection = self._connection()
+        now = time()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            # Возвращаем в очередь задачи с истёкшей арендой
+            connection.execute(
+                "UPDATE items SET state = CASE WHEN attempts >= ? THEN ? ELSE ? END, "
+                "lease_owner = NULL, leased_until = NULL, updated_at = ? "
+                "WHERE state = ? AND leased_until < ?",
+                (self.max_attempts, FAILED, PENDING, now, IN_PROGRESS, now)
+            )
+            row = connection.execute(
+                "SELECT key, kind, payload FROM items WHERE state = ? "
+                "ORDER BY priority, created_at LIMIT 1",
+                (PENDING,)
+            ).fetchone()
+            if row is None:
+                connection.execute("COMMIT")
+                return None
+            connection.execute(
+                "UPDATE items SET state = ?, attempts = attempts + 1, lease_owner = ?, "
+                "leased_until = ?, updated_at = ? WHERE key = ?",
+                (IN_PROGRESS, owner, now + self.lease_timeout, now, row[0])
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        key, kind, payload = row
+        return key, kind, tuple(json.loads(payload))
+
+    def renew(self, key: str, owner: str) -> bool:
+        """Продлевает аренду; False - задача уже не за этим владельцем"""
+        now = time()
+        return self._write(
+            "UPDATE items SET leased_until = ?, updated_at = ? WHERE key = ? AND state = ? AND lease_owner = ?",
+            (now + self.lease_timeout, now, key, IN_PROGRESS, owner)
+        ) > 0
+
+    def complete(self, key: str, owner: str) -> bool:
+        """False - аренду перехватил другой воркер, и задача остаётся за ним"""
+        return self._write(
+            "UPDATE items SET state = ?, lease_owner = NULL, leased_until = NULL, error = NULL, "
+            "updated_at = ? WHERE key = ? AND state = ? AND lease_owner = ?",
+            (DONE, time(), key, IN_PROGRESS, owner)
+        ) > 0
+
+    def fail(self, key: str, owner: str, error: str) -> bool:
+        """Возвращает задачу в очередь или помечает failed, если попытки исчерпаны"""
+        return self._write(
+            "UPDATE items SET state = CASE WHEN attempts >= ? THEN ? ELSE ? END, "
+            "lease_owner = NULL, leased_until = NULL, error = ?, updated_at = ? "
+            "WHERE key = ? AND state = ? AND lease_owner = ?",
+            (self.max_attempts, FAILED, PENDING, error, time(), key, IN_PROGRESS, owner)
+        ) > 0
+
+    def release_dead_leases(self) -> int:
+        """
+        Досрочно возвращает в очередь задачи, арендованные завершившимися процессами этого хоста
+        (владелец аренды - lease_owner()). Чужие хосты и живые процессы не трогаются:
+        их задачи вернутся по истечении аренды. Попытка, на которой упал процесс, засчитывается,
+        поэтому задача, роняющая парсер, не повторяется бесконечно.
+        """
+        host = socket.gethostname()
+        owners = self._connection().execute(
+            "SELECT DISTINCT lease_owner FROM items WHERE state = ?", (IN_PROGRESS,)
+        ).fetchall()
+        dead = []
+        for owner, in owners:
+            parsed = parse_owner(owner)
+            if parsed is not None and parsed[0] == host and not process_alive(parsed[1]):
+                dead.append(owner)
+        released = 0
+        for owner in dead:
+            released += self._write(
+                "UPDATE items SET state = CASE WHEN attempts >= ? THEN ? ELSE ? END, "
+                "lease_owner = NULL, leased_until = NULL, updated_at = ? WHERE state = ? AND lease_owner = ?",
+                (self.max_attempts, FAILED, PENDING, time(), IN_PROGRESS, owner)
+            )
+        return released
+
+    def counts(self) -> dict[str, int]:
+        """Количество задач в каждом состоянии"""
+        rows = self._connection().execute("SELECT state, COUNT(*) FROM items GROUP BY state").fetchall()
+        return dict(rows)
+
+    def has_unfinished(self) -> bool:
+        row = self._connection().execute(
+            "SELECT 1 FROM items WHERE state IN (?, ?) LIMIT 1", (PENDING, IN_PROGRESS)
+        ).fetchone()
+        return row is not None
+
+    def get_meta(self, key: str) -> Optional[str]:
+        row = self._connection().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str):
+        self._write("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def pause_remaining(self, pause: float) -> float:
+        """Сколько ещё ждать до следующего прохода с момента окончания предыдущего"""
+        finished_at = self.get_meta("pass_finished_at")
+        if finished_at is None:
+            return 0.0
+        return max(0.0, float(finished_at) + pause - time())
+
+    def start_pass(self, category_urls: list[str]):
+        """Очищает завершённый проход и засевает фронтир категориями"""
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute("DELETE FROM items")
+            connection.execute("DELETE FROM meta WHERE key = 'pass_finished_at'")
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        for link in category_urls:
+            self.add("category", link)
+        self.set_meta("pass_started_at", str(time()))
+
+    def finish_pass(self):
+        self.set_meta("pass_finished_at", str(time()))
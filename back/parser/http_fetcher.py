@@ -0,0 +1,108 @@
+import asyncio
+import threading
+from time import monotonic
+from typing import Optional
+
+import httpx
+
+from parser.extractors import extract_characteristics
+from parser.pacing import is_challenge_html, rate_limiter
+
+
+HTTP_CONCURRENCY = 16           # Максимум одновременных запросов
+HTTP_KEEPALIVE = 16             # Сколько соединений держать открытыми между запросами
+HTTP_TIMEOUT = 15               # Таймаут запроса, сек
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+                  "(KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "ru-RU,ru;q=0.9,en;q=0.8",
+}
+
+CHARACTERISTICS_MARKER = "product-characteristics__spec-title"
+
+
+def is_challenge_page(status_code: int, html: str) -> bool:
+    """
+    Проверяет, похож ли ответ на страницу антибот-защиты.
+    Такой ответ нельзя разобрать без браузера.
+    """
+    if status_code != 200:
+        return True
+    if is_challenge_html(html):
+        return True
+    return CHARACTERISTICS_MARKER not in html
+
+
+class CharacteristicsFetcher:
+    """
+    Загружает страницы /characteristics/ напрямую по HTTP.
+    Держит собственный цикл asyncio в фоновом потоке и один пул keep-alive соединений,
+    поэтому им можно пользоваться из нескольких потоков парсера одновременно.
+    Если вместо страницы товара пришла защита, возвращает None - тогда нужен браузер.
+    """
+
+    def __init__(self, concurrency: int = HTTP_CONCURRENCY, timeout: float = HTTP_TIMEOUT, **client_kwargs):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        # Дополнительные параметры httpx.AsyncClient (например, transport для локального сервера)
+        self.client_kwargs = client_kwargs
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="http-fetcher", daemon=True)
+        self.thread.start()
+        self.client: Optional[httpx.AsyncClient] = None
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        asyncio.run_coroutine_threadsafe(self._open(), self.loop).result()
+
+    async def _open(self):
+        # Клиент и семафор создаются внутри цикла, которому они принадлежат
+        self.client = httpx.AsyncClient(
+            headers=HEADERS,
+            timeout=self.timeout,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=self.concurrency,
+                                max_keepalive_connections=HTTP_KEEPALIVE),
+            **self.client_kwargs,
+        )
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+
+    async def fetch_async(self, url: str) -> Optional[dict]:
+        """Загружает и разбирает одну страницу характеристик"""
+        try:
+            async with self.semaphore:
+                await rate_limiter.acquire_async(url)
+                started = monotonic()
+                try:
+                    response = await self.client.get(url)
+                except httpx.HTTPError:
+                    rate_limiter.report(url, False, monotonic() - started)
+                    raise
+            challenge = is_challenge_page(response.status_code, response.text)
+            # Страница защиты - сигнал, что мы торопимся: ограничитель снизит скорость
+            rate_limiter.report(url, not challenge, monotonic() - started)
+            if challenge:
+                return None
+            return extract_characteristics(response.text, url)
+        except Exception as error:
+            print(f"Ошибка HTTP-загрузки {url}: {error}")
+            return None
+
+    async def fetch_many_async(self, urls: list[str]) -> dict[str, Optional[dict]]:
+        results = await asyncio.gather(*(self.fetch_async(url) for url in urls))
+        return dict(zip(urls, results))
+
+    def fetch(self, url: str) -> Optional[dict]:
+        """Синхронная обёртка для вызова из потоков парсера"""
+        return asyncio.run_coroutine_threadsafe(self.fetch_async(url), self.loop).result()
+
+    def fetch_many(self, urls: list[str]) -> dict[str, Optional[dict]]:
+        """Загружает пачку страниц параллельно, возвращает {url: данные или None}"""
+        return asyncio.run_coroutine_threadsafe(self.fetch_many_async(urls), self.loop).result()
+
+    def close(self):
+        if self.client is not None:
+            asyncio.run_coroutine_threadsafe(self.client.aclose(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
@@ -0,0 +1,170 @@
+import asyncio
+import threading
+
+from time import monotonic, sleep
+from typing import Callable, Optional
+from urllib.parse import urlsplit
+
+from undetected_chromedriver import Chrome
+
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+
+
+INITIAL_RATE = 2.0          # Стартовая скорость, запросов в секунду на хост
+MIN_RATE = 0.2              # Нижняя граница скорости при ошибках
+MAX_RATE = 10.0             # Верхняя граница скорости
+RATE_INCREASE = 0.1         # Аддитивный прирост после успешного ответа
+RATE_DECREASE = 0.5         # Мультипликативное снижение после ошибки или медленного ответа
+SLOW_RESPONSE = 5.0         # Ответ дольше этого времени считается признаком перегрузки, сек
+BURST = 3                   # Сколько запросов можно сделать подряд без ожидания
+
+READY_TIMEOUT = 10          # Максимальное ожидание готовности DOM, сек
+
+OPINION_SELECTOR = "div.ow-opinion[data-role='opinion']"
+
+# Признаки страницы антибот-защиты вместо запрошенной
+CHALLENGE_MARKERS = ("qrator", "captcha", "challenge-form", "доступ ограничен", "проверка браузера")
+
+
+class PageBlocked(Exception):
+    """Вместо страницы сайт отдал антибот-защиту"""
+
+
+class TokenBucket:
+    """Корзина токенов одного хоста со скоростью, меняющейся по правилу AIMD"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = monotonic()
+
+    def reserve(self) -> float:
+        """Забирает токен и возвращает, сколько нужно подождать до его появления"""
+        now = monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class AdaptiveRateLimiter:
+    """
+    Ограничитель частоты запросов по хостам.
+    Пока ответы быстрые и успешные, скорость растёт на RATE_INCREASE,
+    при ошибке или медленном ответе - уменьшается в 1 / RATE_DECREASE раз.
+    Потокобезопасен и общий для всех браузеров и HTTP-клиента.
+    """
+
+    def __init__(self, initial_rate: float = INITIAL_RATE, min_rate: float = MIN_RATE,
+                 max_rate: float = MAX_RATE, burst: int = BURST, slow_response: float = SLOW_RESPONSE):
+        self.initial_rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.slow_response = slow_response
+        self.buckets: dict[str, TokenBucket] = {}
+        self.lock = threading.Lock()
+
+    def _reserve(self, url: str) -> float:
+        host = urlsplit(url).netloc
+        with self.lock:
+            bucket = self.buckets.get(host)
+            if bucket is None:
+                bucket = self.buckets[host] = TokenBucket(self.initial_rate, self.burst)
+            return bucket.reserve()
+
+    def acquire(self, url: str):
+        """Блокирует поток, пока хост не разрешит следующий запрос"""
+        delay = self._reserve(url)
+        if delay > 0:
+            sleep(delay)
+
+    async def acquire_async(self, url: str):
+        delay = self._reserve(url)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def report(self, url: str, ok: bool, elapsed: float):
+        """Сообщает результат запроса и подстраивает скорость хоста"""
+        host = urlsplit(url).netloc
+        with self.lock:
+            bucket = self.buckets.get(host)
+            if bucket is None:
+                return
+            if ok and elapsed < self.slow_response:
+                bucket.rate = min(self.max_rate, bucket.rate + RATE_INCREASE)
+            else:
+                bucket.rate = max(self.min_rate, bucket.rate * RATE_DECREASE)
+
+    def rate(self, url: str) -> float:
+        """Текущая скорость для хоста, запросов в секунду"""
+        with self.lock:
+            bucket = self.buckets.get(urlsplit(url).netloc)
+            return bucket.rate if bucket else self.initial_rate
+
+
+rate_limiter = AdaptiveRateLimiter()
+
+
+def wait_for(driver: Chrome, condition: Callable, timeout: float = READY_TIMEOUT):
+    """Ждёт выполнения условия, возвращает его результат или None по таймауту"""
+    try:
+        return WebDriverWait(driver, timeout).until(condition)
+    except TimeoutException:
+        return None
+
+
+def is_challenge_html(html: str) -> bool:
+    """Страница антибот-защиты вместо запрошенной"""
+    lowered = html.lower()
+    return any(marker in lowered for marker in CHALLENGE_MARKERS)
+
+
+def open_page(driver: Chrome, url: str, ready_selector: Optional[str] = None,
+              timeout: float = READY_TIMEOUT) -> bool:
+    """
+    Открывает страницу с учётом ограничителя частоты и ждёт появления ready_selector
+    вместо фиксированной паузы. Возвращает False, если элемент так и не появился.
+    Вместо страницы пришла защита - PageBlocked.
+    Скорость хоста снижается при ошибке, защите, медленной загрузке и если элемент не дождались:
+    у страниц, где его может не быть (товар без отзывов), ready_selector - список селекторов
+    через запятую, включающий и признак пустой страницы.
+    """
+    rate_limiter.acquire(url)
+    started = monotonic()
+    try:
+        driver.get(url)
+        # Время загрузки без ожидания элемента: таймаут ожидания не должен считаться медленным ответом
+        elapsed = monotonic() - started
+        ready = True
+        if ready_selector:
+            ready = wait_for(driver, EC.presence_of_element_located((By.CSS_SELECTOR, ready_selector)),
+                             timeout) is not None
+        driver.execute_script("window.stop();")
+        blocked = not ready and is_challenge_html(driver.page_source)
+    except Exception:
+        rate_limiter.report(url, False, monotonic() - started)
+        raise
+    rate_limiter.report(url, ready, elapsed)
+    if blocked:
+        raise PageBlocked(url)
+    return ready
+
+
+def count_opinions(driver: Chrome) -> int:
+    return len(driver.find_elements(By.CSS_SELECTOR, OPINION_SELECTOR))
+
+
+class opinion_count_changed:
+    """Условие ожидания: количество отзывов на странице стало больше previous"""
+
+    def __init__(self, previous: int):
+        self.previous = previous
+
+    def __call__(self, driver: Chrome):
+        count = count_opinions(driver)
+        return count if count > self.previous else False
@@ -0,0 +1,46 @@
+import os
+
+import pytest
+
+from parser.extractors import ENGINES, extract_characteristics, extract_opinions
+
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "..", "parser", "fixtures")
+PAGES = sorted(name for name in os.listdir(FIXTURES_DIR) if name.endswith(".html"))
+
+
+def read_page(name: str) -> str:
+    with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as f:
+        return f.read()
+
+
+def test_fixtures_cover_both_page_types():
+    assert any(name.endswith(".characteristics.html") for name in PAGES)
+    assert any(name.endswith(".opinion.html") for name in PAGES)
+
+
+@pytest.mark.parametrize("engine", sorted(set(ENGINES) - {"bs4"}))
+@pytest.mark.parametrize("name", [name for name in PAGES if name.endswith(".characteristics.html")])
+def test_characteristics_match_bs4(name, engine):
+    html = read_page(name)
+    url = f"https://www.dns-shop.ru/product/{name.split('.')[0]}/characteristics/"
+    assert extract_characteristics(html, url, engine) == extract_characteristics(html, url, "bs4")
+
+
+@pytest.mark.parametrize("engine", sorted(set(ENGINES) - {"bs4"}))
+@pytest.mark.parametrize("name", [name for name in PAGES if name.endswith(".opinion.html")])
+def test_opinions_match_bs4(name, engine):
+    html = read_page(name)
+    assert extract_opinions(html, engine) == extract_opinions(html, "bs4")
+
+
+def test_reference_extraction():
+    """Эталон сам по себе разбирает сложные места: старую цену, комментарии, script и style"""
+    data = extract_characteristics(read_page("5067631.characteristics.html"),
+                                   "https://www.dns-shop.ru/product/5067631/characteristics/", "bs4")
+    assert data["Цена"] == 54999
+    assert data["Категория"] == "Смартфоны"
+    assert data["Характеристики"]["Модель"] == "Example XPro"
+    reviews, blocks = extract_opinions(read_page("5067631.opinion.html"), "bs4")
+    assert blocks == 3
+    assert reviews[0]["Оценки по категориям"] == {"Экран": 5, "Автономность": 3}
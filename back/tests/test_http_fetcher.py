@@ -0,0 +1,119 @@
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import sleep
+
+import httpx
+import pytest
+
+from parser import http_fetcher
+from parser.http_fetcher import CharacteristicsFetcher
+from parser.pacing import AdaptiveRateLimiter
+
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "..", "parser", "fixtures")
+with open(os.path.join(FIXTURES_DIR, "5067631.characteristics.html"), encoding="utf-8") as f:
+    PRODUCT_PAGE = f.read().encode()
+CHALLENGE_PAGE = "<html><body>Проверка браузера... qrator</body></html>".encode()
+
+
+class LocalShop(BaseHTTPRequestHandler):
+    """Подменяет сайт: /good/ - страница товара, /forbidden/ - 403, /challenge/ - страница защиты"""
+    protocol_version = "HTTP/1.1"       # keep-alive, чтобы было видно переиспользование соединений
+    delay = 0.05
+    lock = threading.Lock()
+    active = 0
+    max_active = 0
+    connections: set = set()
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            cls.active += 1
+            cls.max_active = max(cls.max_active, cls.active)
+            cls.connections.add(self.client_address)
+        sleep(cls.delay)
+        with cls.lock:
+            cls.active -= 1
+        if "/forbidden/" in self.path:
+            status, body = 403, b"Forbidden"
+        elif "/challenge/" in self.path:
+            status, body = 200, CHALLENGE_PAGE
+        else:
+            status, body = 200, PRODUCT_PAGE
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def shop():
+    LocalShop.active = LocalShop.max_active = 0
+    LocalShop.connections = set()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), LocalShop)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def fast_rate_limiter(monkeypatch):
+    # Общий ограничитель с боевой скоростью растянул бы тест на секунды
+    monkeypatch.setattr(http_fetcher, "rate_limiter", AdaptiveRateLimiter(initial_rate=1000, burst=1000))
+
+
+@pytest.fixture
+def fetcher():
+    fetcher = CharacteristicsFetcher(concurrency=4)
+    yield fetcher
+    fetcher.close()
+
+
+def test_product_page_is_extracted(shop, fetcher):
+    url = f"{shop}/product/good/characteristics/"
+    data = fetcher.fetch(url)
+    assert data["Наименование"] == "Смартфон Example X8/256 ГБ"
+    assert data["Цена"] == 54999
+    assert data["Ссылка"] == f"{shop}/product/good/"
+    assert data["Характеристики"]["Оперативная память"] == "8ГБ"
+
+
+@pytest.mark.parametrize("path", ["/product/forbidden/characteristics/", "/product/challenge/characteristics/"])
+def test_blocked_page_falls_back_to_browser(shop, fetcher, path):
+    assert fetcher.fetch(shop + path) is None
+
+
+def test_fetch_many_runs_concurrently_and_reuses_connections(shop, fetcher):
+    urls = [f"{shop}/product/good{i}/characteristics/" for i in range(20)]
+    urls.append(f"{shop}/product/forbidden/characteristics/")
+    first = fetcher.fetch_many(urls[:10])
+    second = fetcher.fetch_many(urls[10:])
+    results = {**first, **second}
+
+    assert list(results) == urls
+    assert all(results[url] is not None for url in urls[:-1])
+    assert results[urls[-1]] is None
+    # Запросы идут параллельно, но не больше concurrency
+    assert 1 < LocalShop.max_active <= 4
+    # 21 запрос уложился в пул keep-alive соединений
+    assert len(LocalShop.connections) <= 4
+
+
+def test_mock_transport_is_accepted():
+    """Клиенту можно подставить транспорт httpx без сети"""
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(403 if "blocked" in request.url.path else 200, content=PRODUCT_PAGE)
+
+    fetcher = CharacteristicsFetcher(transport=httpx.MockTransport(handler))
+    try:
+        assert fetcher.fetch("https://www.dns-shop.ru/product/1/characteristics/")["Цена"] == 54999
+        assert fetcher.fetch("https://www.dns-shop.ru/product/blocked/characteristics/") is None
+    finally:
+        fetcher.close()